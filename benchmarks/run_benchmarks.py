@@ -0,0 +1,239 @@
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+
+from utils.cache import simulation_cache
+from utils.dice import roll_counts
+from utils.gbm import sample_gbm_terminal
+from utils.histogram import FixedEdgeHistogram
+from utils.util_functions import (
+    build_gbm_colored_histogram_figure,
+    calculate_long_call_payoff,
+    calculate_long_put_payoff,
+    call_option_asset,
+    gbm_histogram_figure,
+    gbm_paths_figure,
+    simulate_gbm_end_values,
+    simulate_gbm_paths,
+    simulate_gbm_paths_plotly_histogram_with_bins,
+    simulate_gbm_paths_plotly_histogram_with_bins_and_color,
+)
+
+# Times the simulators, payoff functions and pricers at several scales and writes the
+# results as JSON, so two runs (or a run and a stored baseline) can be compared.
+# Run from the repository root:
+#   python -m benchmarks.run_benchmarks --output results.json
+#   python -m benchmarks.run_benchmarks --quick --baseline benchmarks/baseline.json
+#   python -m benchmarks.run_benchmarks --save-baseline benchmarks/baseline.json
+# Simulators run in compute-only mode (plot=False). Where a case has a figure, building
+# it (at the app's 200 drawn paths) and serializing it to JSON, which is what
+# st.plotly_chart sends to the browser, is timed separately.
+
+PATH_COUNTS = (10**2, 10**3, 10**4, 10**5, 10**6)
+DAYS = (1, 30, 90)
+GRID_SIZES = (10**4, 10**5, 10**6, 10**7)
+ROLL_COUNTS = (10**3, 10**5, 10**7, 10**8)
+
+QUICK_PATH_COUNTS = (10**2, 10**3, 10**4)
+QUICK_DAYS = (1, 30)
+QUICK_GRID_SIZES = (10**4, 10**6)
+QUICK_ROLL_COUNTS = (10**3, 10**6)
+
+STEPS_PER_DAY = 24
+DISPLAY_PATHS = 200
+SIMULATION = dict(s0=200, mu=0.0, sigma=0.005, n=STEPS_PER_DAY, seed=0)
+STRIKE = 205
+
+
+def measure(run, repeat):
+    # Best wall time over repeat runs, then one more run under tracemalloc for the peak
+    # memory (numpy reports its buffers to it), kept apart since tracing slows allocation.
+    # The cases use a fixed seed, so the shock cache is emptied before every run: otherwise
+    # repeats would skip drawing the shocks (and leave them out of the peak), and a case's
+    # numbers would depend on which cases ran before it.
+    times = []
+    for _ in range(repeat):
+        simulation_cache.clear()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    simulation_cache.clear()
+    tracemalloc.start()
+    result = run()
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, min(times), peak_bytes
+
+
+def measure_figure(build, figure_input, repeat):
+    def run():
+        return len(build(figure_input).to_json())
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        figure_bytes = run()
+        times.append(time.perf_counter() - start)
+    return min(times), figure_bytes
+
+
+def benchmark_cases(quick=False, max_cells=3*10**7):
+    # Yields (name, params, run, work, unit, figure) where work is how many units one
+    # run processes and figure, if not None, is (build, input) with input either a
+    # callable or None to use the run's result. Full path matrices above max_cells
+    # values are skipped, since 10^6 paths over 90 days wouldn't fit in memory.
+    path_counts, days, grid_sizes, roll_counts_ = ((QUICK_PATH_COUNTS, QUICK_DAYS, QUICK_GRID_SIZES, QUICK_ROLL_COUNTS) if quick
+                                                   else (PATH_COUNTS, DAYS, GRID_SIZES, ROLL_COUNTS))
+
+    for T in days:
+        for num_paths in path_counts:
+            params = dict(num_paths=num_paths, T=T, n=STEPS_PER_DAY)
+            if num_paths*STEPS_PER_DAY*T <= max_cells:
+                yield ('simulate_gbm_paths', params,
+                       lambda T=T, num_paths=num_paths: simulate_gbm_paths(T=T, num_paths=num_paths, plot=False, **SIMULATION),
+                       num_paths, 'paths',
+                       (lambda paths: gbm_paths_figure(*paths, max_display_paths=DISPLAY_PATHS), None))
+                yield ('simulate_gbm_paths_plotly_histogram_with_bins', params,
+                       lambda T=T, num_paths=num_paths: simulate_gbm_paths_plotly_histogram_with_bins(T=T, num_paths=num_paths, plot=False, **SIMULATION),
+                       num_paths, 'paths',
+                       (lambda histogram: gbm_histogram_figure(*histogram, max_display_paths=DISPLAY_PATHS), None))
+
+            # Only the drawn paths are simulated step by step here, so every size fits
+            colored = dict(T=T, num_paths=num_paths, display_paths=DISPLAY_PATHS, **SIMULATION)
+            yield ('simulate_gbm_paths_plotly_histogram_with_bins_and_color', dict(params, display_paths=DISPLAY_PATHS),
+                   lambda colored=colored: simulate_gbm_paths_plotly_histogram_with_bins_and_color(strike_threshold=STRIKE, plot=False, **colored),
+                   num_paths, 'paths',
+                   (lambda simulation: build_gbm_colored_histogram_figure(simulation, STRIKE),
+                    lambda colored=colored: simulate_gbm_end_values(**colored)))
+
+    for num_paths in path_counts:
+        end_values = sample_gbm_terminal(200, 0.0, 0.005, T=30, num_paths=num_paths, seed=0)
+        yield ('call_option_asset', dict(num_paths=num_paths),
+               lambda end_values=end_values: call_option_asset(end_values, STRIKE, display=False),
+               num_paths, 'paths', None)
+        yield ('FixedEdgeHistogram.update', dict(num_paths=num_paths, num_bins=20),
+               lambda end_values=end_values: FixedEdgeHistogram.lognormal(200, 0.0, 0.005, T=30, num_bins=20, strike=STRIKE).update(end_values),
+               num_paths, 'paths', None)
+
+    for size in grid_sizes:
+        grid = np.linspace(100, 300, size)
+        for payoff in (calculate_long_call_payoff, calculate_long_put_payoff):
+            yield (payoff.__name__, dict(grid_size=size),
+                   lambda payoff=payoff, grid=grid: payoff(grid, STRIKE, 2.5),
+                   size, 'prices', None)
+
+    for num_rolls in roll_counts_:
+        yield ('roll_counts', dict(num_rolls=num_rolls), lambda num_rolls=num_rolls: roll_counts(num_rolls, seed=0),
+               num_rolls, 'rolls', None)
+
+
+def run_benchmarks(quick=False, repeat=3, max_cells=3*10**7, pattern=None, verbose=True):
+    results = []
+    for name, params, run, work, unit, figure in benchmark_cases(quick=quick, max_cells=max_cells):
+        if pattern is not None and pattern not in name:
+            continue
+        result, seconds, peak_bytes = measure(run, repeat)
+        record = dict(name=name, params=params, seconds=seconds, throughput=work/seconds if seconds > 0 else None,
+                      unit=f'{unit}/s', peak_bytes=peak_bytes)
+
+        if figure is not None:
+            build, figure_input = figure
+            figure_input = result if figure_input is None else figure_input()
+            record['figure_seconds'], record['figure_bytes'] = measure_figure(build, figure_input, repeat)
+        del result
+
+        results.append(record)
+        if verbose:
+            print(format_record(record), flush=True)
+    return results
+
+
+def format_record(record):
+    params = ' '.join(f'{key}={value}' for key, value in record['params'].items())
+    line = (f"{record['name']:<56} {params:<42} {record['seconds']*1e3:10.2f} ms "
+            f"{record['throughput']:12.3g} {record['unit']:<9} {record['peak_bytes']/2**20:9.1f} MiB")
+    if 'figure_seconds' in record:
+        line += f"  figure {record['figure_seconds']*1e3:.1f} ms, {record['figure_bytes']/2**10:.0f} KiB"
+    return line
+
+
+def case_key(record):
+    return (record['name'], json.dumps(record['params'], sort_keys=True))
+
+
+def compare_to_baseline(results, baseline, tolerance=0.25, min_seconds=1e-3):
+    # A case regresses when its time, peak memory or figure time is more than tolerance
+    # above the baseline's. Timings below min_seconds are too noisy to flag.
+    baseline_records = {case_key(record): record for record in baseline['results']}
+    regressions = []
+    for record in results:
+        previous = baseline_records.get(case_key(record))
+        if previous is None:
+            continue
+        for metric in ('seconds', 'figure_seconds', 'peak_bytes'):
+            if metric not in record or metric not in previous:
+                continue
+            if metric != 'peak_bytes' and max(record[metric], previous[metric]) < min_seconds:
+                continue
+            if record[metric] > previous[metric]*(1 + tolerance):
+                regressions.append(dict(name=record['name'], params=record['params'], metric=metric,
+                                        baseline=previous[metric], current=record[metric],
+                                        ratio=record[metric]/previous[metric] if previous[metric] else np.inf))
+    return regressions
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return dict(timestamp=datetime.now(timezone.utc).isoformat(), commit=commit, python=platform.python_version(),
+                numpy=np.__version__, platform=platform.platform(), processor=platform.processor() or platform.machine())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the simulators, payoff functions and pricers.')
+    parser.add_argument('--quick', action='store_true', help='smaller scales, for a fast check')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per case, the best time is kept')
+    parser.add_argument('--max-cells', type=int, default=3*10**7, help='skip path matrices with more values than this')
+    parser.add_argument('--only', help='only run cases whose name contains this')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare against the results in this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='relative slowdown flagged as a regression')
+    parser.add_argument('--save-baseline', help='also write the results to this JSON file as the new baseline')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(quick=args.quick, repeat=args.repeat, max_cells=args.max_cells, pattern=args.only)
+    report = dict(environment=environment(), quick=args.quick, repeat=args.repeat, results=results)
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        report['baseline'] = dict(path=args.baseline, environment=baseline.get('environment'), tolerance=args.tolerance)
+        report['regressions'] = compare_to_baseline(results, baseline, tolerance=args.tolerance)
+        for regression in report['regressions']:
+            print(f"REGRESSION {regression['name']} {regression['params']} {regression['metric']}: "
+                  f"{regression['baseline']:.4g} -> {regression['current']:.4g} ({regression['ratio']:.2f}x)")
+        if report['regressions']:
+            status = 1
+        else:
+            print(f"No regressions against {args.baseline}")
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+import argparse
+import os
+import sys
+import tempfile
+import traceback
+
+import numpy as np
+
+from utils.parallel import parallel_option_price
+from utils.pricing import price_gbm_option
+from utils.util_functions import (
+    simulate_gbm_paths,
+    simulate_gbm_paths_plotly_histogram_with_bins,
+    simulate_gbm_paths_plotly_histogram_with_bins_and_color,
+)
+
+# Runs every simulator once in each execution mode (serial, worker processes, paths on
+# disk, Sobol points, Generator seed) at a small size, so an argument that doesn't make
+# it through one of the dispatch paths shows up before the page hits it:
+#   python -m benchmarks.smoke_check
+# Exits 1 if any case raises or returns values that aren't finite. Path counts are powers
+# of two so the Sobol points stay balanced.
+
+SIMULATION = dict(s0=200, mu=0.0, sigma=0.005, n=24, T=2, num_paths=256, seed=0)
+
+
+def smoke_cases(storage_dir):
+    modes = dict(
+        serial=dict(),
+        workers=dict(workers=2),
+        storage=dict(storage=os.path.join(storage_dir, 'paths.npy')),
+        sobol=dict(sampler='sobol'),
+        generator_seed=dict(seed=np.random.default_rng(0)),
+    )
+    for mode, options in modes.items():
+        params = dict(SIMULATION, plot=False, **options)
+        yield ('simulate_gbm_paths', mode, lambda params=params: simulate_gbm_paths(**params)[1])
+        yield ('simulate_gbm_paths_plotly_histogram_with_bins', mode,
+               lambda params=params: simulate_gbm_paths_plotly_histogram_with_bins(**params)[1])
+        if 'storage' not in options:
+            # The colored histogram draws most end values straight from S_T, never storing paths
+            yield ('simulate_gbm_paths_plotly_histogram_with_bins_and_color', mode,
+                   lambda params=params: simulate_gbm_paths_plotly_histogram_with_bins_and_color(display_paths=128, strike_threshold=201, **params)[0])
+
+    for mode, pricer in (('serial', price_gbm_option), ('workers', lambda *args, **kwargs: parallel_option_price(*args, workers=2, **kwargs))):
+        yield ('streaming_option_price', mode,
+               lambda pricer=pricer: np.array([pricer(200, 0.0, 0.005, 205, T=2, max_paths=20000, seed=0, num_bins=20).price]))
+
+
+def run_smoke_checks(pattern=None, verbose=True):
+    failures = []
+    with tempfile.TemporaryDirectory() as storage_dir:
+        for name, mode, run in smoke_cases(storage_dir):
+            if pattern is not None and pattern not in name:
+                continue
+            try:
+                values = np.asarray(run())
+                if not np.all(np.isfinite(values)):
+                    raise ValueError("returned values that aren't finite")
+                status = 'ok'
+            except Exception:
+                failures.append((name, mode, traceback.format_exc()))
+                status = 'FAILED'
+            if verbose:
+                print(f"{name:<56} {mode:<15} {status}", flush=True)
+
+    for name, mode, error in failures:
+        print(f"\n{name} ({mode}):\n{error}")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run every simulator once in each execution mode.')
+    parser.add_argument('--only', help='only run cases whose name contains this')
+    args = parser.parse_args(argv)
+    return 1 if run_smoke_checks(pattern=args.only) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,12 +1,55 @@
+import os
+import uuid
+from fractions import Fraction
+
 import streamlit as st
 import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+
+from utils.util_functions import (
+    calculate_long_call_payoff,
+    calculate_long_put_payoff,
+    simulate_gbm_paths,
+    simulate_gbm_paths_plotly_histogram_with_bins,
+    simulate_gbm_paths_plotly_histogram_with_bins_and_color,
+    call_option_asset,
+    call_option_asset_streaming,
+    call_option_asset_qmc,
+    black_scholes_option_asset,
+    option_greeks_table,
+    simulate_delta_hedge,
+    american_option_asset,
+    plotly_chart,
+    rerun_timings_sidebar,
+    timed_fragment,
+    cached_simulation,
+)
+from utils.black_scholes import black_scholes_price
+from utils.cache import SimulationCache, simulation_cache
+from utils.dice import FACES, exact_probabilities, expected_payoff, payoff_distribution, roll_counts
+from utils.implied_vol import implied_volatility
+from utils.profiling import RerunProfiler, section
+from utils.gbm import sample_gbm_terminal
+from utils.strategies import Strategy
+from utils.strategy_search import model_leg_universe, search_strategies
 
 # Define the Streamlit app
 st.title("Options Explainer")
 
+# Reruns are only timed while the debug sidebar is open or a log file is set. The
+# profiler is kept in session state, so its history is this session's last reruns.
+show_timings_input = st.sidebar.checkbox('Show rerun timings (debug)')
+profile_log = os.environ.get('OPTIONS_EXPLAINER_PROFILE_LOG')
+if 'profiler' not in st.session_state:
+    st.session_state['profiler'] = RerunProfiler(session=uuid.uuid4().hex[:8], max_reruns=20, log_path=profile_log)
+profiler = st.session_state['profiler']
+profiler.enabled = show_timings_input or bool(profile_log)
+if profiler.enabled:
+    profiler.start()
+
+section('Key ideas')
+
 st.write("""## Key Ideas of Options
 
 Options give us fine grained exposure to different levels of prices, letting us express detailed beliefs about future price distributions.
@@ -68,28 +111,27 @@ Notice that when the shoes are worth anything less than 200 dollars, we simply d
 """)
 
 
-min_price_initial = 50
-max_price_initial = 400
-
-strike_price_initial = 200
-premium_initial = 10
+# The fixed diagrams are the same on every rerun, so they're built once per process
+def build_coupon_figure():
+    min_price_initial = 50
+    max_price_initial = 400
 
-underlying_prices_plot = np.linspace(min_price_initial, max_price_initial, 8)
+    strike_price_initial = 200
+    premium_initial = 10
 
-def calculate_long_call_payoff(underlying_prices, strike_price, premium):
-    payoffs = np.where(underlying_prices <= strike_price, -premium, (underlying_prices - strike_price) - premium)
-    return payoffs
+    underlying_prices_plot = np.linspace(min_price_initial, max_price_initial, 8)
 
-payoffs_plot = calculate_long_call_payoff(underlying_prices_plot, strike_price_initial, premium_initial)
+    payoffs_plot = calculate_long_call_payoff(underlying_prices_plot, strike_price_initial, premium_initial)
 
-fig = px.line(x=underlying_prices_plot, y=payoffs_plot, labels={"x": "LeBron Shoe Value", "y": "Profit"})
-fig.update_layout(
-    title=f"Coupon Profit Diagram",
-    xaxis_title="LeBron Shoe Value",
-    yaxis_title="Profit"
-)
+    fig = px.line(x=underlying_prices_plot, y=payoffs_plot, labels={"x": "LeBron Shoe Value", "y": "Profit"})
+    fig.update_layout(
+        title=f"Coupon Profit Diagram",
+        xaxis_title="LeBron Shoe Value",
+        yaxis_title="Profit"
+    )
+    return fig
 
-st.plotly_chart(fig)
+plotly_chart(cached_simulation('coupon_figure', {}, build_coupon_figure, use_cache=True))
 
 
 st.write("""
@@ -104,26 +146,32 @@ Play around with the parameters a bit, try to answer the following questions/do
 
 """)
 
-strike_price_input = st.slider(
-    'Select the discounted price to buy shoes at!',
-    0, 500, 200)
+@timed_fragment('Coupon payoff')
+def coupon_payoff_section():
+    strike_price_input = st.slider(
+        'Select the discounted price to buy shoes at!',
+        0, 500, 200)
 
-premium_input = st.slider(
-    'Select the price we paid for the coupon!',
-    0, 500, 10)
+    premium_input = st.slider(
+        'Select the price we paid for the coupon!',
+        0, 500, 10)
 
-underlying_prices_shoes = np.linspace(0, 500, (500))
+    underlying_prices_shoes = np.linspace(0, 500, (500))
 
-payoffs_shoes = calculate_long_call_payoff(underlying_prices_shoes, strike_price_input, premium_input)
+    payoffs_shoes = calculate_long_call_payoff(underlying_prices_shoes, strike_price_input, premium_input)
 
-fig2 = px.line(x=underlying_prices_shoes, y=payoffs_shoes, labels={"x": "LeBron Shoe Value", "y": "Profit"})
-fig2.update_layout(
-    title=f"Coupon Profit Diagram",
-    xaxis_title="LeBron Shoe Value",
-    yaxis_title="Profit"
-)
+    fig2 = px.line(x=underlying_prices_shoes, y=payoffs_shoes, labels={"x": "LeBron Shoe Value", "y": "Profit"})
+    fig2.update_layout(
+        title=f"Coupon Profit Diagram",
+        xaxis_title="LeBron Shoe Value",
+        yaxis_title="Profit"
+    )
+
+    plotly_chart(fig2)
+
+coupon_payoff_section()
 
-st.plotly_chart(fig2)
+section('Handbag')
 
 st.write("""
 
@@ -180,22 +228,40 @@ max_price_bag = 2000
 strike_price_bag = 1500
 premium_bag = 200
 
-underlying_prices_bag = np.linspace(min_price_bag, max_price_bag, max_price_bag-min_price_bag)
+def build_coworker_deal_figure(min_price_bag, max_price_bag, strike_price_bag, premium_bag):
+    underlying_prices_bag = np.linspace(min_price_bag, max_price_bag, max_price_bag-min_price_bag)
 
-def calculate_long_put_payoff(underlying_prices, strike_price, premium):
-    put_payoffs = np.where(underlying_prices <= strike_price, (strike_price - underlying_prices) - premium, -premium)
-    return put_payoffs
+    payoffs_bag = calculate_long_put_payoff(underlying_prices_bag, strike_price_bag, premium_bag)
 
-payoffs_bag = calculate_long_put_payoff(underlying_prices_bag, strike_price_bag, premium_bag)
+    fig_bag = px.line(x=underlying_prices_bag, y=payoffs_bag, labels={"x": "Designer Handbag Value", "y": "Profit"})
+    fig_bag.update_layout(
+        title=f"Coworker Deal Profit Diagram",
+        xaxis_title="Designer Handbag Value",
+        yaxis_title="Profit"
+    )
+    return fig_bag
 
-fig_bag = px.line(x=underlying_prices_bag, y=payoffs_bag, labels={"x": "Designer Handbag Value", "y": "Profit"})
-fig_bag.update_layout(
-    title=f"Coworker Deal Profit Diagram",
-    xaxis_title="Designer Handbag Value",
-    yaxis_title="Profit"
-)
+plotly_chart(cached_simulation('coworker_deal_figure', dict(min_price_bag=min_price_bag, max_price_bag=max_price_bag,
+                                                         strike_price_bag=strike_price_bag, premium_bag=premium_bag),
+                               build_coworker_deal_figure, use_cache=True))
+
+st.write("""Notice that the deal lets you sell the handbag **any time** in the next year, not just on the last day. 
+That's worth something extra: if handbags crash early, you can sell right away and put the 1500 dollars in the bank to earn interest, instead of waiting until the year is up.
+
+Here's what the deal would be worth both ways, with the handbag's price bouncing around like the stock simulations further down the page:
+""")
+
+@timed_fragment('Early exercise')
+def early_exercise_section():
+    bag_sigma_input = st.slider('Select how volatile handbag prices are!', 1, 50, 30)
+    bag_rate_input = st.slider('Select the yearly interest rate you could earn in the bank (%)', 0.0, 20.0, 5.0, 0.5)
+
+    american_option_asset(s0=2000, strike_value=strike_price_bag, T=365, sigma=bag_sigma_input/1e3, r=np.log(1 + bag_rate_input/100)/365,
+                          option_type='put', seed=42, use_cache=True)
 
-st.plotly_chart(fig_bag)
+early_exercise_section()
+
+section('Dice')
 
 st.write("""
 
@@ -264,103 +330,111 @@ So the answer is somewhere in between these bounds.
 
 We can try to figure out how much the option is worth by simulating the dice roll a bunch of times, and finding the average value of the option over time.
 
-Let's roll a dice 100,000 times, and plot a histogram of the rolls that we get
+Let's roll a dice 100,000 times (or pick another number of rolls below), and plot a histogram of the rolls that we get
 
 
 """)
 
 
 
-def roll_dice():
-    return np.random.randint(1, 7)
-
-
-dice_strike = st.slider("Select the strike price of the option", 1, 6, 3)
-
-# Generate random dice rolls
-rolls = [roll_dice() for _ in range(100000)]
-
-hist, bin_edges = np.histogram(rolls, bins=6, range=(1, 7))
-
-# Define colors based on bin values
-colors = ['green' if bin_value > dice_strike else 'red' for bin_value in bin_edges[0:]]
+@timed_fragment('Dice')
+def dice_section():
+    dice_strike = st.slider("Select the strike price of the option", 1, 6, 3)
+    num_dice_rolls = st.select_slider("Number of rolls", options=[10**k for k in range(3, 9)], value=100000, format_func=lambda x: f"{x:,}")
+    exact_dice_input = st.checkbox("Use the exact probabilities instead of rolling (each face has a 1/6 chance)")
 
-# Create a bar chart using Plotly
-fig_dice = go.Figure()
-fig_dice.add_trace(go.Bar(
-    x=bin_edges[0:],
-    y=hist,
-    marker_color=colors,
-    text=hist,
-    textposition='outside'
-))
-
-# Update the layout
-fig_dice.update_layout(
-    title=f"Dice Roll Histogram (Strike Price: {dice_strike})",
-    xaxis_title="Dice Value",
-    yaxis_title="Frequency"
-)
+    if exact_dice_input:
+        hist = exact_probabilities()
+    else:
+        # Only the face counts are kept, once per process for each number of rolls
+        hist = simulation_cache.get_or_compute(SimulationCache.make_key('roll_counts', dict(num_rolls=num_dice_rolls)),
+                                               lambda: roll_counts(num_dice_rolls))
+
+    # Define colors based on bin values
+    colors = np.where(FACES > dice_strike, 'green', 'red')
+
+    # Create a bar chart using Plotly
+    fig_dice = go.Figure()
+    fig_dice.add_trace(go.Bar(
+        x=FACES,
+        y=hist,
+        marker_color=colors,
+        text=np.round(hist, 4),
+        textposition='outside'
+    ))
+
+    # Update the layout
+    fig_dice.update_layout(
+        title=f"Dice Roll Histogram (Strike Price: {dice_strike})",
+        xaxis_title="Dice Value",
+        yaxis_title="Probability" if exact_dice_input else "Frequency"
+    )
 
-# Display the histogram
-st.plotly_chart(fig_dice)
+    # Display the histogram
+    plotly_chart(fig_dice)
 
-st.write("""We'll also plot out the payoff, or profit, of having that option for each roll:
+    st.write("""We'll also plot out the payoff, or profit, of having that option for each roll:
 
 Red means the option ended up being worth 0 after the die roll, and green means it was worth a positive amount, denoted by the value at the bottom of the bar
 """)
 
-dice_payoffs = [roll-dice_strike if roll > dice_strike else 0 for roll in rolls]
-
-hist_payoffs, bin_edges_payoffs = np.histogram(dice_payoffs, bins=7-dice_strike, range=(0, 7-dice_strike))
-
-# Define colors based on bin values
-colors_dice_payoffs = ['green' if bin_value > 0 else 'red' for bin_value in bin_edges_payoffs[0:]]
-
-# Create a bar chart using Plotly
-fig_dice_payoff = go.Figure()
-fig_dice_payoff.add_trace(go.Bar(
-    x=bin_edges_payoffs[0:],
-    y=hist_payoffs,
-    marker_color=colors_dice_payoffs,
-    text=hist_payoffs,
-    textposition='outside'
-))
-
-# Update the layout
-fig_dice_payoff.update_layout(
-    title=f"Dice Call Option Payoff Histogram (Strike Price: {dice_strike})",
-    xaxis_title="Option Payoff",
-    yaxis_title="Frequency"
-)
+    bin_edges_payoffs, hist_payoffs = payoff_distribution(hist, dice_strike)
+
+    # Define colors based on bin values
+    colors_dice_payoffs = np.where(bin_edges_payoffs > 0, 'green', 'red')
+
+    # Create a bar chart using Plotly
+    fig_dice_payoff = go.Figure()
+    fig_dice_payoff.add_trace(go.Bar(
+        x=bin_edges_payoffs,
+        y=hist_payoffs,
+        marker_color=colors_dice_payoffs,
+        text=np.round(hist_payoffs, 4),
+        textposition='outside'
+    ))
+
+    # Update the layout
+    fig_dice_payoff.update_layout(
+        title=f"Dice Call Option Payoff Histogram (Strike Price: {dice_strike})",
+        xaxis_title="Option Payoff",
+        yaxis_title="Probability" if exact_dice_input else "Frequency"
+    )
 
-st.plotly_chart(fig_dice_payoff)
+    plotly_chart(fig_dice_payoff)
 
-probabilities = hist_payoffs / np.sum(hist_payoffs)
-expected_value = np.sum(probabilities * bin_edges_payoffs[:-1])
+    probabilities = hist_payoffs / np.sum(hist_payoffs)
+    expected_value = expected_payoff(hist, dice_strike)
+    if exact_dice_input:
+        # Every outcome is a multiple of 1/6, so show exact fractions instead of rounded floats
+        probabilities = [Fraction(p).limit_denominator(6) for p in probabilities]
+        expected_value = Fraction(expected_value).limit_denominator(6)
 
-latex_string_dice = ""
+    latex_string_dice = ""
 
-for i in range(len(probabilities)):
-    if i == len(probabilities)-1:
-        latex_string_dice += f"{probabilities[i]} \\times {bin_edges_payoffs[i]} = {expected_value}"
-    else:
-        latex_string_dice += f"{probabilities[i]} \\times {bin_edges_payoffs[i]} + "
+    for i in range(len(probabilities)):
+        if i == len(probabilities)-1:
+            latex_string_dice += f"{probabilities[i]} \\times {bin_edges_payoffs[i]} = {expected_value}"
+        else:
+            latex_string_dice += f"{probabilities[i]} \\times {bin_edges_payoffs[i]} + "
         
-st.write("""
-Now we can calculate the average price of the option over the 100,000 rolls, and that should be pretty close to what the option is actually worth!
+    st.write("""
+Now we can calculate the average price of the option over all the rolls, and that should be pretty close to what the option is actually worth!
 
 We multiply each payoff by the probability of getting each of the payoffs, and add them all together, effectively a weighted average
 
 So for each outcome $i$
 """)
 
-st.latex('''
+    st.latex('''
 \\text{average value} = \\sum_i^n \\text{probability of outcome i} \\times \\text{payoff of outcome i}''')
 
-st.write(""" plugging in the values from the histogram above, we find that the strike selected's average value is: """)
+    st.write(""" plugging in the values from the histogram above, we find that the strike selected's average value is: """)
+
+    st.latex(latex_string_dice)
 
-st.latex(latex_string_dice)
+dice_section()
+
+section('GBM demos')
 
 st.write("""
 
@@ -399,84 +473,14 @@ Here's how we're going to simulate a stock's potential future paths:
 There's some technical detail being glossed over in the above explanation, but feel free to look up geometric brownian motion if you want to learn more about the specifics!
 """)
 
-def simulate_gbm_paths(s0, mu, sigma, n=24, T=30, num_paths=1000, plot=True):
-    dt = 1/n
-    t = np.linspace(0, T, n*T+1)
-    S = np.zeros((num_paths, n*T+1))
-    
-    for i in range(num_paths):
-        W = np.random.standard_normal(size=n*T+1)
-        W = np.cumsum(W)*np.sqrt(dt)
-        X = (mu-0.5*sigma**2)*t + sigma*W
-        S[i,:] = s0*np.exp(X)
-        
-        
-    fig_paths = go.Figure()
-    for i in range(num_paths):
-        fig_paths.add_trace(go.Scatter(x=t, y=S[i,:], mode='lines', name=f'Path {i+1}'))
-
-    fig_paths.update_layout(
-        title='Simulated Stock Paths',
-        xaxis_title='Time',
-        yaxis_title='Price',
-        showlegend=True,
-        width=800,
-        height=500,
-    )
-    if plot:
-        st.plotly_chart(fig_paths)
-
-
-simulate_gbm_paths(s0=200, mu=0.0005, sigma=0.005, n=24, T=30, num_paths=10, plot=True)
+simulate_gbm_paths(s0=200, mu=0.0005, sigma=0.005, n=24, T=30, num_paths=10, plot=True, use_cache=True)
 
 st.write("""Now that we've simulated some paths, let's look at the distribution of outcomes these paths might create! 
 
 Let's generate a lot more paths: 100 should be a good number to start with
 """)
 
-def simulate_gbm_paths_plotly_histogram_with_bins(s0, mu, sigma, n=24, T=30, num_paths=1000, num_bins=20):
-    dt = 1/n
-    t = np.linspace(0, T, n*T+1)
-    S = np.zeros((num_paths, n*T+1))
-    
-    for i in range(num_paths):
-        W = np.random.standard_normal(size=n*T+1)
-        W = np.cumsum(W)*np.sqrt(dt)
-        X = (mu-0.5*sigma**2)*t + sigma*W
-        S[i,:] = s0*np.exp(X)
-    
-    # Calculate end values
-    end_values = S[:, -1]
-    
-    # Calculate histogram data
-    hist_values, bin_edges = np.histogram(end_values, bins=num_bins)
-    
-    # Create subplots with one row and two columns
-    fig = make_subplots(rows=1, cols=2, subplot_titles=('Stock Paths', 'End Value Histogram'), column_widths=[0.7, 0.3])
-    
-    # Add GBM paths to the first subplot
-    for i in range(num_paths):
-        fig.add_trace(go.Scatter(x=t, y=S[i,:], mode='lines', name=f'Path {i+1}'), row=1, col=1)
-
-    
-    # Add a bar chart with bins and counts to the second subplot
-    fig.add_trace(go.Bar(y=bin_edges[:-1], x=hist_values, orientation='h', name='End Values'), row=1, col=2)
-    
-    # Update layout
-    fig.update_layout(
-        title='Simulated Stock Paths and Expiration Price Distribution',
-        xaxis_title='Counts',
-        yaxis_title='Price',
-        xaxis2=dict(domain=[0.75, 1.0]),
-        yaxis2=dict(anchor='x2'),
-        showlegend=False,  # Set to False to avoid legend duplication
-        width=1000,
-        height=500,
-    )
-    
-    st.plotly_chart(fig)
-
-simulate_gbm_paths_plotly_histogram_with_bins(s0=200, mu=0.0, sigma=0.005, n=24, T=30, num_paths=100)
+simulate_gbm_paths_plotly_histogram_with_bins(s0=200, mu=0.0, sigma=0.005, n=24, T=30, num_paths=100, use_cache=True)
 
 # Example usage:
 # simulate_gbm_paths_plotly_with_histogram(s0=100, mu=0.05, sigma=0.2, n=24, T=30, num_paths=5)
@@ -492,53 +496,7 @@ Let's do it again, and clearly mark the 'profitable' and 'unprofitable' zones: o
 
 For now, we'll set the strike price to be 205.""")
 
-def simulate_gbm_paths_plotly_histogram_with_bins_and_color(s0, mu, sigma, n=24, T=30, num_paths=1000, num_bins=20, strike_threshold=200):
-    dt = 1/n
-    t = np.linspace(0, T, n*T+1)
-    S = np.zeros((num_paths, n*T+1))
-    
-    for i in range(num_paths):
-        W = np.random.standard_normal(size=n*T+1)
-        W = np.cumsum(W)*np.sqrt(dt)
-        X = (mu-0.5*sigma**2)*t + sigma*W
-        S[i,:] = s0*np.exp(X)
-    
-    # Calculate end values
-    end_values = S[:, -1]
-    
-    # Calculate histogram data
-    hist_values, bin_edges = np.histogram(end_values, bins=num_bins)
-    
-    # Create subplots with one row and two columns
-    fig = make_subplots(rows=1, cols=2, subplot_titles=('Stock Paths', 'End Value Histogram'), column_widths=[0.7, 0.3])
-    
-    # Add GBM paths to the first subplot
-    for i in range(num_paths):
-        fig.add_trace(go.Scatter(x=t, y=S[i,:], mode='lines', name=f'Path {i+1}'), row=1, col=1)
-
-    colors_strike = ['red' if x < strike_threshold else 'green' for x in bin_edges[:-1]]
-    
-    # Add a bar chart with bins and counts to the second subplot
-    fig.add_trace(go.Bar(y=bin_edges[:-1], x=hist_values, orientation='h', marker_color=colors_strike, name='End Values'), row=1, col=2)
-    
-    # Update layout
-    fig.update_layout(
-        title='Simulated Stock Paths and Colored Expiration Price Distribution',
-        xaxis_title='Counts',
-        yaxis_title='Price',
-        xaxis2=dict(domain=[0.75, 1.0]),
-        yaxis2=dict(anchor='x2'),
-        showlegend=False,  # Set to False to avoid legend duplication
-        width=1000,
-        height=500,
-    )
-    
-    st.plotly_chart(fig)
-
-    return end_values, strike_threshold
-
-
-end_prices, strike_value = simulate_gbm_paths_plotly_histogram_with_bins_and_color(s0=200, mu=0.0, sigma=0.005, n=24, T=30, num_paths=100, strike_threshold=205)
+end_prices, strike_value = simulate_gbm_paths_plotly_histogram_with_bins_and_color(s0=200, mu=0.0, sigma=0.005, n=24, T=30, num_paths=100, strike_threshold=205, use_cache=True)
 
 st.write("""
 
@@ -546,15 +504,10 @@ st.write("""
 
 Let's not look at the calculation exactly here, since it would be a bit long, but according to the simulation, the price of the option is, on average: """)
 
-def call_option_asset(end_values, strike_value):
-    payoffs = end_values - strike_value
-    payoffs = np.clip(payoffs, 0, None)
-    st.latex("\\text{Simulated Fair Price: }")
-    st.latex(payoffs.mean())
-    return payoffs.mean()
-
 call_option_asset(end_prices, strike_value)
 
+section('Playground')
+
 st.write(""" 
 
 ### Price your own options! 
@@ -580,45 +533,193 @@ What's the relation between the colors of the end value distribution and the opt
 
 """)
 
-st.write("""Current Price (what price is the stock at right now?)""")
+# Sections nested in the playground below
+@timed_fragment('Implied volatility')
+def implied_volatility_section(s0_input, strike_val_input, time_to_expiry_input, sigma_input):
+    option_price_input = st.number_input(
+        'Enter the price of the option!',
+        min_value=0.0, value=round(float(black_scholes_price(s0_input, strike_val_input, time_to_expiry_input, sigma_input/1e3)), 4), format='%.4f')
 
-s0_input = st.slider(
-    'Select the price the stock is currently at!',
-    100, 1000, 200)
+    implied_vol_input = float(implied_volatility(option_price_input, s0_input, strike_val_input, time_to_expiry_input))
 
+    st.latex("\\text{Implied Volatility: }")
+    if np.isnan(implied_vol_input):
+        st.write("No volatility can produce that price: it is either below what the option is already worth today, or above the price of the stock itself.")
+    else:
+        st.latex(f"{implied_vol_input*1e3:.4f}")
 
-st.write("""Strike Value (what price do we get the option to buy the stock at?)""")
 
-strike_val_input = st.slider(
-    'Select the strike price of the option!',
-    int(s0_input*0.8), int(s0_input*1.2), s0_input)
+# Listed strikes are a dollar apart, so "one strike above and below" is 53.2 and 55.2
+twitter_structures = {
+    'Short two calls at 54.2, long the wings': Strategy.butterfly(54.2, 1),
+    'The same with puts': Strategy.butterfly(54.2, 1, option_type='put'),
+    'Short calls one strike either side of 54.2, long the next ones out (a condor)': Strategy.condor([52.2, 53.2, 55.2, 56.2]),
+}
+twitter_prices = np.linspace(50, 58.4, 841)
 
-st.write("""Time to Expiry (how many days until the option expires?)""")
 
-time_to_expiry_input = st.slider(
-    'Select the amount of days until the option expires!',
-    1, 90, 30)
+def build_twitter_structure_figure(structure):
+    fig_twitter = px.line(x=twitter_prices, y=twitter_structures[structure].payoff(twitter_prices),
+                          labels={"x": "Twitter Share Price at Expiry", "y": "Payoff"})
+    fig_twitter.update_layout(
+        title=structure,
+        xaxis_title="Twitter Share Price at Expiry",
+        yaxis_title="Payoff"
+    )
+    return fig_twitter
 
-# st.write("""Stock Drift (does it tend to go up or down?)""")
-# mu_input = st.slider(
-#     'Select how much the stock trends up or down!',
-#     -25, 25, 5)
 
-st.write("""Stock Volatility (how wiggly are the price movements?)""")
+@timed_fragment('Structure picker')
+def twitter_structure_section():
+    twitter_structure_input = st.selectbox('Pick a structure to see what it pays at expiry', list(twitter_structures))
+    plotly_chart(cached_simulation('twitter_structure_figure', dict(structure=twitter_structure_input), build_twitter_structure_figure, use_cache=True))
 
-sigma_input = st.slider(
-    'Select how volatile the stock is!',
-    0, 25, 5)
 
-end_prices_interactive, strike_val_input = simulate_gbm_paths_plotly_histogram_with_bins_and_color(s0=s0_input, 
-                                                                                                   mu=0.0, sigma=sigma_input/1e3, 
-                                                                                                   n=24, T=time_to_expiry_input, 
-                                                                                                   num_paths=200, 
-                                                                                                   strike_threshold=strike_val_input)
+def search_twitter_structures(pinned, budget, max_loss):
+    strikes = np.arange(42, 67, 0.5)
+    legs = model_leg_universe(52.0, strikes, 30, 0.015)
+    if pinned:
+        end_prices = np.random.default_rng(0).normal(54.2, 0.2, 20000)
+    else:
+        end_prices = sample_gbm_terminal(52.0, 0.0, 0.015, T=30, num_paths=20000, seed=0)
+    return end_prices, search_strategies(legs, end_prices, budget=budget, max_loss=max_loss)
 
-call_option_asset(end_prices_interactive, strike_val_input)
 
-st.write("""
+def build_twitter_search_figure(best_strategy):
+    fig_twitter_search = px.line(x=twitter_prices, y=best_strategy.profit(twitter_prices),
+                                 labels={"x": "Twitter Share Price at Expiry", "y": "Profit"})
+    fig_twitter_search.update_layout(
+        title=f"Best structure found: {best_strategy}",
+        xaxis_title="Twitter Share Price at Expiry",
+        yaxis_title="Profit"
+    )
+    return fig_twitter_search
+
+
+@timed_fragment('Strategy search')
+def strategy_search_section():
+    twitter_target_input = st.radio('Where do you think the stock ends up?',
+                                    ['Pinned at 54.2 (the deal closes)', 'Wherever the market expects (same volatility the options are priced at)'])
+    twitter_budget_input = st.slider('Most you are willing to pay for the structure', 0.0, 5.0, 1.0, 0.1)
+    twitter_max_loss_input = st.slider('Most you are willing to lose at expiry', 0.0, 10.0, 2.0, 0.1)
+
+    twitter_search_params = dict(pinned=twitter_target_input.startswith('Pinned'), budget=twitter_budget_input, max_loss=twitter_max_loss_input)
+    twitter_end_prices, twitter_results = simulation_cache.get_or_compute(
+        SimulationCache.make_key('search_strategies', twitter_search_params), lambda: search_twitter_structures(**twitter_search_params))
+
+    if twitter_results:
+        st.table({
+            'Structure': [str(result.strategy) for result in twitter_results],
+            'Cost': [f"{result.net_premium:.2f}" for result in twitter_results],
+            'Expected Profit': [f"{result.score:.2f}" for result in twitter_results],
+            'Max Loss': [f"{result.max_loss:.2f}" for result in twitter_results],
+        })
+        # Keyed on the search, since the same search always finds the same best structure
+        plotly_chart(cached_simulation('twitter_search_figure', twitter_search_params,
+                                       lambda **params: build_twitter_search_figure(twitter_results[0].strategy), use_cache=True))
+    else:
+        st.write("Nothing fits within that budget and maximum loss, try loosening them.")
+
+
+@timed_fragment('Delta hedging demo')
+def delta_hedge_section(s0_input, strike_val_input, time_to_expiry_input, sigma_input, simulation_seed):
+    realized_sigma_input = st.slider('Select how volatile the stock actually turns out to be!', 0, 25, sigma_input)
+    rebalance_labels = {'Every hour': 1, 'Every 4 hours': 4, 'Once a day': 24}
+    rebalance_input = rebalance_labels[st.selectbox('How often do we re-hedge?', list(rebalance_labels))]
+
+    simulate_delta_hedge(s0=s0_input, strike_value=strike_val_input, T=time_to_expiry_input, implied_sigma=max(sigma_input, 1)/1e3,
+                         realized_sigma=realized_sigma_input/1e3, rebalance_every=rebalance_input, seed=simulation_seed, use_cache=True)
+
+
+# Everything from here to the delta hedging demo reads the playground's inputs, so it's
+# all one fragment. The sections defined above are nested fragments inside it, so their
+# own widgets only rerun themselves.
+@timed_fragment('Playground')
+def playground_section():
+    st.write("""Current Price (what price is the stock at right now?)""")
+
+    s0_input = st.slider(
+        'Select the price the stock is currently at!',
+        100, 1000, 200)
+
+
+    st.write("""Strike Value (what price do we get the option to buy the stock at?)""")
+
+    strike_val_input = st.slider(
+        'Select the strike price of the option!',
+        int(s0_input*0.8), int(s0_input*1.2), s0_input)
+
+    st.write("""Time to Expiry (how many days until the option expires?)""")
+
+    time_to_expiry_input = st.slider(
+        'Select the amount of days until the option expires!',
+        1, 90, 30)
+
+    # st.write("""Stock Drift (does it tend to go up or down?)""")
+    # mu_input = st.slider(
+    #     'Select how much the stock trends up or down!',
+    #     -25, 25, 5)
+
+    st.write("""Stock Volatility (how wiggly are the price movements?)""")
+
+    sigma_input = st.slider(
+        'Select how volatile the stock is!',
+        0, 25, 5)
+
+    st.write("""Variance Reduction (tricks that make the simulated price settle down with fewer paths)""")
+
+    variance_reduction_labels = {
+        'None': None,
+        'Antithetic paths': 'antithetic',
+        'Control variate': 'control_variate',
+        'Moment matching': 'moment_matching',
+    }
+    variance_reduction_input = variance_reduction_labels[st.selectbox(
+        'Select a variance reduction technique!',
+        list(variance_reduction_labels), index=2)]
+
+    qmc_input = st.checkbox('Also price it with quasi-random (Sobol) points, which settle down with far fewer paths')
+
+    # The same random shocks are reused on every rerun, so moving a slider shows exactly
+    # how the price responds instead of mixing in fresh simulation noise
+    simulation_seed = 42
+
+    instant_pricing_input = st.checkbox('Skip the simulation and just give me the exact (Black-Scholes) price!')
+
+    if instant_pricing_input:
+        black_scholes_option_asset(s0=s0_input, strike_value=strike_val_input, T=time_to_expiry_input, sigma=sigma_input/1e3)
+        end_prices_interactive = None
+    else:
+        end_prices_interactive, strike_val_input = simulate_gbm_paths_plotly_histogram_with_bins_and_color(s0=s0_input, 
+                                                                                                           mu=0.0, sigma=sigma_input/1e3, 
+                                                                                                           n=24, T=time_to_expiry_input, 
+                                                                                                           num_paths=20000, 
+                                                                                                           strike_threshold=strike_val_input,
+                                                                                                           display_paths=200,
+                                                                                                           variance_reduction=variance_reduction_input,
+                                                                                                           seed=simulation_seed,
+                                                                                                           use_cache=True)
+
+        # The closed form answer sits next to the simulated one so the two can be compared
+        simulated_col, exact_col = st.columns(2)
+        with simulated_col:
+            call_option_asset_streaming(s0=s0_input, mu=0.0, sigma=sigma_input/1e3, strike_value=strike_val_input, T=time_to_expiry_input,
+                                        variance_reduction=variance_reduction_input, seed=simulation_seed)
+            if qmc_input:
+                # Whole daily paths, built with a Brownian bridge so the end value still
+                # comes from the first (best spread) Sobol dimension
+                call_option_asset_qmc(s0=s0_input, mu=0.0, sigma=sigma_input/1e3, strike_value=strike_val_input, T=time_to_expiry_input,
+                                      n=1, seed=simulation_seed)
+        with exact_col:
+            black_scholes_option_asset(s0=s0_input, strike_value=strike_val_input, T=time_to_expiry_input, sigma=sigma_input/1e3)
+
+    with st.expander("Option Greeks for this option (per day, explained further down the page)"):
+        option_greeks_table(s0=s0_input, strike_value=strike_val_input, T=time_to_expiry_input, sigma=sigma_input/1e3,
+                            end_values=end_prices_interactive)
+
+    section('Greeks and implied volatility')
+
+    st.write("""
 
 ### Lessons from Histograms
 
@@ -674,7 +775,16 @@ But one thing we don't know is:
 If we know an option's volatility, we can work out what the price of the option should be. 
 
 Vice versa, if we know the price of an option, we can work out the 'implied volatility' of an option. 
+""")
+
+    st.write("""Try it below: type in a price for the option you built in the section above, and we'll back out the volatility that price implies (in the same units as the volatility slider). 
+The exact price from above should give you back the volatility you picked!""")
 
+    implied_volatility_section(s0_input, strike_val_input, time_to_expiry_input, sigma_input)
+
+    section('Strategies')
+
+    st.write("""
 Unlike in the model shown above, volatility is not constant over time. 
 
 One obvious example of stock volatility changing is news announcements. Apple's share price is likely to be more volatile when a new iPhone releases, than when nothing big and interesting is happening with the company. 
@@ -750,6 +860,19 @@ There's a lot of ways to express the above opinion, that Twitter will be exactly
 - the exact same as the above, but with puts
 
 Think about why this might be the case!
+""")
+
+    twitter_structure_section()
+
+    st.write("""You can also let the computer search for a structure. Say the stock trades at 52 a month before the deal closes, and the options are priced with a normal amount of volatility (0.015 in the volatility slider's units, divided by 1000).
+It tries every combination of up to four long or short calls and puts on 50 strikes, and ranks them by what they're expected to make if the stock really does end up where you think it will.
+""")
+
+    strategy_search_section()
+
+    section('Delta hedging')
+
+    st.write("""
 
 #### What if I'm right about my trade on volatility, but wrong about the price movement? 
 
@@ -772,6 +895,19 @@ If an option has 0.5 delta, then it moves 50 cents for each dollar movement in t
 So if your option has 0.5 delta, and moves 50 cents for every dollar movement in the underlying stock, you probably want to buy 50 shares of the stock. (this is because a stock option multiplier is 100 shares, 100 x 0.5 = 50)
 
 This means, in order to purely trade volatility, we can 'delta hedge' our risk due to the underlying stock's movement by buying shares (or selling them) 
+""")
+
+    st.write("""Try it below with the option from the playground above: we buy it at the volatility you picked there (its implied volatility), then simulate the stock with a different realized volatility and keep re-hedging the delta along every path.
+The more often we re-hedge, the more the profit only depends on whether realized volatility came in above or below implied.
+""")
+
+    delta_hedge_section(s0_input, strike_val_input, time_to_expiry_input, sigma_input, simulation_seed)
+
+playground_section()
+
+section('Closing notes')
+
+st.write("""
 
 ### What's Put Call Parity?
 
@@ -832,3 +968,8 @@ https://x.com/therobotjames/status/1444832714922758148?s=20
 
 
 """)
+
+profiler.finish()
+if show_timings_input:
+    num_reruns_input = st.sidebar.slider('Reruns to compare', 1, 20, 5)
+    rerun_timings_sidebar(profiler, num_reruns=num_reruns_input)
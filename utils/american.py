@@ -0,0 +1,109 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from utils.black_scholes import option_sign
+
+# American options in the simulators' units: T in days and sigma, r per day.
+
+
+@dataclass
+class AmericanPrice:
+    price: float
+    european_price: float
+    early_exercise_premium: float
+    std_error: float = 0.0
+
+
+def binomial_american_price(s0, strike, T, sigma, r=0.0, option_type='put', steps=2000):
+    # Cox-Ross-Rubinstein tree. The American and European values are rolled back
+    # together as the two columns of one array, so each step of the backward induction
+    # is a few array operations on a whole level, and the stock prices at every level
+    # are strided views of one precomputed ladder. strike may be an array, in which case
+    # every strike is priced on the same tree.
+    dt = T/steps
+    u = np.exp(sigma*np.sqrt(dt))
+    p = (np.exp(r*dt) - 1/u)/(u - 1/u)
+    # Nodes at step k sit at s0*u^(2j - k), every other rung of the ladder
+    ladder = s0*u**np.arange(-steps, steps + 1, dtype=np.float64)
+    return _roll_back(ladder, strike, r*dt, option_type, steps, (1 - p, p), lambda k: slice(steps - k, steps + k + 1, 2))
+
+
+def trinomial_american_price(s0, strike, T, sigma, r=0.0, option_type='put', steps=2000):
+    # Boyle's trinomial tree, with the middle branch keeping the price unchanged
+    dt = T/steps
+    up, down = np.exp(sigma*np.sqrt(dt/2)), np.exp(-sigma*np.sqrt(dt/2))
+    p_up = ((np.exp(r*dt/2) - down)/(up - down))**2
+    p_down = ((up - np.exp(r*dt/2))/(up - down))**2
+    # Nodes at step k sit at s0*u^(j - k) with u = exp(sigma*sqrt(2*dt))
+    ladder = s0*np.exp(sigma*np.sqrt(2*dt))**np.arange(-steps, steps + 1, dtype=np.float64)
+    return _roll_back(ladder, strike, r*dt, option_type, steps, (p_down, 1 - p_up - p_down, p_up), lambda k: slice(steps - k, steps + k + 1))
+
+
+def _roll_back(ladder, strike, r_dt, option_type, steps, probabilities, level):
+    w = option_sign(option_type)
+    strike = np.asarray(strike, dtype=np.float64)
+    ladder = ladder.reshape((-1,) + (1,)*strike.ndim)
+    # Exercise values for the whole ladder and discounted branch probabilities are
+    # computed once, which leaves only the roll back and one maximum per step
+    exercise_ladder = w*(ladder - strike)
+    probabilities = [probability*np.exp(-r_dt) for probability in probabilities]
+    branches = len(probabilities)
+
+    exercise_value = np.maximum(exercise_ladder[level(steps)], 0)
+    values = np.stack([exercise_value, exercise_value], axis=1)
+    for k in range(steps - 1, -1, -1):
+        width = values.shape[0] - branches + 1
+        rolled = probabilities[0]*values[:width]
+        for branch in range(1, branches):
+            rolled += probabilities[branch]*values[branch:branch + width]
+        values = rolled
+        # Only the American column can be exercised early
+        np.maximum(values[:, 0], exercise_ladder[level(k)], out=values[:, 0])
+
+    return _american_price(values[0, 0], values[0, 1])
+
+
+def longstaff_schwartz_price(t, S, strike, r=0.0, option_type='put', exercise_every=1, degree=3):
+    # Least-squares Monte Carlo on a path matrix from the GBM engine (simulated with
+    # mu = r). Walking back over the exercise dates (every exercise_every steps), the
+    # value of holding on is regressed on a polynomial in S/strike across all the paths
+    # that are in the money, and those paths exercise where that's worth less than
+    # exercising now. Each date is one least-squares fit over the whole cross-section.
+    # The same paths are used for the fit and the price, which biases it slightly high.
+    t = np.asarray(t, dtype=np.float64)
+    w = option_sign(option_type)
+    dates = np.arange(t.size - 1, 0, -exercise_every)
+
+    value = np.maximum(w*(np.asarray(S[:, -1], dtype=np.float64) - strike), 0)
+    european = value*np.exp(-r*(t[-1] - t[0]))
+    previous = dates[0]
+    for date in dates[1:]:
+        value *= np.exp(-r*(t[previous] - t[date]))
+        previous = date
+
+        S_date = np.asarray(S[:, date], dtype=np.float64)
+        exercise_value = np.maximum(w*(S_date - strike), 0)
+        in_the_money = exercise_value > 0
+        if np.count_nonzero(in_the_money) <= degree + 1:
+            continue
+
+        basis = np.vander(S_date[in_the_money]/strike, degree + 1)
+        # Normal equations: the basis is a few well-scaled columns (S/strike is near 1)
+        coefficients = np.linalg.solve(basis.T @ basis, basis.T @ value[in_the_money])
+        exercise = exercise_value[in_the_money] > basis @ coefficients
+        value[np.flatnonzero(in_the_money)[exercise]] = exercise_value[in_the_money][exercise]
+    value *= np.exp(-r*(t[previous] - t[0]))
+
+    # Exercising straight away is also allowed
+    immediate = float(np.maximum(w*(np.mean(S[:, 0]) - strike), 0))
+    price = max(float(value.mean()), immediate)
+    european_price = float(european.mean())
+    std_error = float(value.std(ddof=1)/np.sqrt(value.size))
+    return AmericanPrice(price, european_price, price - european_price, std_error)
+
+
+def _american_price(american, european):
+    if np.ndim(american) == 0:
+        return AmericanPrice(float(american), float(european), float(american - european))
+    return AmericanPrice(american, european, american - european)
@@ -0,0 +1,94 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class SimulationCache:
+    # Least-recently-used cache for simulated arrays and built figures, keyed on
+    # (simulator, parameters, seed) and bounded by an approximate memory ceiling.
+    # It lives at module level, so every session served by the process shares it,
+    # and cached arrays are made read-only since they're handed to every caller.
+    def __init__(self, max_bytes=256*2**20):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(simulator, params, seed=None):
+        return (simulator, tuple(sorted(params.items())), seed)
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+
+        # Computed outside the lock so a slow simulation doesn't block other sessions
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        nbytes = estimate_nbytes(value)
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            if nbytes > self.max_bytes:
+                # Not stored, so the caller keeps a value it can still modify
+                return
+
+            _make_read_only(value)
+            self._entries[key] = (value, nbytes)
+            self.current_bytes += nbytes
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_bytes
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+def estimate_nbytes(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_nbytes(item) for item in value)
+    if isinstance(value, dict):
+        return sum(estimate_nbytes(item) for item in value.values())
+    if hasattr(value, 'to_plotly_json'):
+        return estimate_nbytes(value.to_plotly_json())
+    return sys.getsizeof(value)
+
+
+def _make_read_only(value):
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _make_read_only(item)
+
+
+simulation_cache = SimulationCache(max_bytes=int(os.environ.get('OPTIONS_EXPLAINER_CACHE_MB', '256'))*2**20)
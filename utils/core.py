@@ -0,0 +1,58 @@
+import numpy as np
+
+from utils.black_scholes import black_scholes_price, option_sign
+from utils.gbm import generate_gbm_paths, sample_gbm_terminal
+
+# The numerical core of the app (GBM simulation, payoffs and fair prices) with no
+# streamlit or plotly imports, so batch jobs and scripts can use it without loading a UI.
+# The simulators and pricers are imported here too, so this is the one place to get
+# them from. util_functions re-exports what the page uses. Same units as the
+# simulators: T in days and sigma, r per day.
+
+
+def calculate_long_call_payoff(underlying_prices, strike_price, premium):
+    payoffs = np.where(underlying_prices <= strike_price, -premium, (underlying_prices - strike_price) - premium)
+    return payoffs
+
+def calculate_long_put_payoff(underlying_prices, strike_price, premium):
+    put_payoffs = np.where(underlying_prices <= strike_price, (strike_price - underlying_prices) - premium, -premium)
+    return put_payoffs
+
+
+def fair_price(end_values, strike_value, option_type='call'):
+    # Average payoff over simulated end values, undiscounted like the rest of the app
+    payoffs = option_sign(option_type)*(np.asarray(end_values) - strike_value)
+    return np.clip(payoffs, 0, None).mean()
+
+
+def monte_carlo_prices(s0, strike, T, sigma, r=0.0, option_type='call', num_paths=10000, max_elements=2**20, seed=None):
+    # Risk-neutral Monte Carlo price and standard error for every contract in a batch
+    # (arguments broadcast like black_scholes_price). Every contract uses the same
+    # normal draws, so a contract's price doesn't depend on which batch it's in, and
+    # contracts are priced a block at a time with at most max_elements end values in memory.
+    s0, strike, T, sigma, r, w = np.broadcast_arrays(*(np.asarray(x, dtype=np.float64) for x in (s0, strike, T, sigma, r)),
+                                                     option_sign(option_type))
+    Z = np.random.default_rng(seed).standard_normal(num_paths)
+
+    prices = np.empty(s0.shape)
+    std_errors = np.empty(s0.shape)
+    flat = [x.ravel() for x in (s0, strike, T, sigma, r, w)]
+    block = max(1, max_elements//num_paths)
+    for start in range(0, s0.size, block):
+        b_s0, b_strike, b_T, b_sigma, b_r, b_w = (x[start:start + block, None] for x in flat)
+        total_vol = b_sigma*np.sqrt(b_T)
+        payoffs = total_vol*Z
+        payoffs += (b_r - 0.5*b_sigma**2)*b_T
+        np.exp(payoffs, out=payoffs)
+        payoffs *= b_s0
+        payoffs -= b_strike
+        payoffs *= b_w
+        np.maximum(payoffs, 0, out=payoffs)
+        payoffs *= np.exp(-b_r*b_T)
+
+        stop = start + payoffs.shape[0]
+        prices.ravel()[start:stop] = payoffs.mean(axis=1)
+        std_errors.ravel()[start:stop] = payoffs.std(axis=1, ddof=1)/np.sqrt(num_paths)
+
+    return prices, std_errors
+
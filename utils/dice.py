@@ -0,0 +1,36 @@
+import numpy as np
+
+FACES = np.arange(1, 7)
+
+
+def roll_counts(num_rolls, chunk_size=10_000_000, seed=None):
+    # How many times each face came up in num_rolls throws. Rolls are drawn a chunk
+    # at a time and only their counts are kept, so 10^8 rolls need one chunk of memory.
+    rng = np.random.default_rng(seed)
+    counts = np.zeros(FACES.size, dtype=np.int64)
+    for start in range(0, num_rolls, chunk_size):
+        rolls = rng.integers(1, 7, size=min(chunk_size, num_rolls-start), dtype=np.int8)
+        counts += np.bincount(rolls, minlength=7)[1:]
+    return counts
+
+
+def exact_probabilities():
+    # A fair die, so there's nothing to sample
+    return np.full(FACES.size, 1/FACES.size)
+
+
+def dice_call_payoffs(faces, strike):
+    return np.maximum(np.asarray(faces) - strike, 0)
+
+
+def payoff_distribution(face_weights, strike):
+    # Folds per-face counts (or probabilities) onto the possible call payoffs
+    # 0, 1, ..., 6-strike, e.g. every face at or below the strike lands on 0
+    payoffs = np.arange(FACES.size + 1 - strike)
+    weights = np.bincount(dice_call_payoffs(FACES, strike), weights=face_weights, minlength=payoffs.size)
+    return payoffs, weights
+
+
+def expected_payoff(face_weights, strike):
+    face_weights = np.asarray(face_weights, dtype=np.float64)
+    return float(np.dot(face_weights, dice_call_payoffs(FACES, strike))/face_weights.sum())
@@ -0,0 +1,135 @@
+import numpy as np
+
+from utils.cache import SimulationCache, simulation_cache
+from utils.profiling import span
+
+# Control variates adjust the estimator rather than the draws, so the simulators
+# accept them but only the pricer changes its behaviour
+VARIANCE_REDUCTION_MODES = (None, 'antithetic', 'control_variate', 'moment_matching')
+# None draws pseudo-random normals, 'sobol' scrambled Sobol points (with a Brownian
+# bridge for paths, see utils.qmc)
+SAMPLERS = (None, 'sobol')
+# child_seed indices for the different uses of one seed, so their draws are independent
+# of each other and of the seed's own stream
+TERMINAL_STREAM = 1  # end values drawn straight from S_T next to simulated paths
+BATCH_STREAM = 2  # the streaming pricer's batches
+
+
+def standard_normals(shape, dtype=np.float64, variance_reduction=None, seed=None):
+    # seed may be None (fresh noise), a numpy Generator, a SeedSequence (e.g. from
+    # child_seed) or an int / tuple of ints
+    if variance_reduction not in VARIANCE_REDUCTION_MODES:
+        raise ValueError(f"variance_reduction must be one of {VARIANCE_REDUCTION_MODES}, got {variance_reduction!r}")
+    rng = np.random.default_rng(seed)
+
+    Z = np.empty(shape, dtype=dtype)
+    if variance_reduction == 'antithetic':
+        # Row i + half is the mirror image of row i
+        half = (Z.shape[0] + 1)//2
+        rng.standard_normal(out=Z[:half], dtype=dtype)
+        np.negative(Z[:Z.shape[0]-half], out=Z[half:])
+    else:
+        rng.standard_normal(out=Z, dtype=dtype)
+
+    if variance_reduction == 'moment_matching' and Z.shape[0] > 1:
+        # Every time step gets exactly zero mean and unit variance across paths
+        Z -= Z.mean(axis=0)
+        Z /= Z.std(axis=0)
+
+    return Z
+
+
+def draw_shocks(shape, dtype=np.float64, variance_reduction=None, seed=None, sampler=None):
+    if sampler not in SAMPLERS:
+        raise ValueError(f"sampler must be one of {SAMPLERS}, got {sampler!r}")
+    if sampler is None:
+        return standard_normals(shape, dtype=dtype, variance_reduction=variance_reduction, seed=seed)
+    if variance_reduction in ('antithetic', 'moment_matching'):
+        raise ValueError(f"Sobol points are already balanced, so they can't be combined with {variance_reduction}")
+    # Imported here since utils.qmc builds on this module
+    from utils.qmc import sobol_shocks
+    return sobol_shocks(shape, dtype=dtype, seed=seed)
+
+
+def shocks(shape, dtype=np.float64, variance_reduction=None, seed=None, sampler=None):
+    # With a fixed integer seed the shock matrix only depends on (seed, shape), so it's
+    # drawn once and kept in the simulation cache. Changing s0, sigma or the strike then
+    # just rescales the same shocks, which saves the RNG cost on every slider move and
+    # keeps comparisons between parameter values free of simulation noise.
+    # The cached matrix is read-only, so callers must not modify it in place. A matrix
+    # too big for the cache is drawn fresh and left writable, so the paths can still be
+    # built in place instead of in a second matrix of the same size.
+    nbytes = int(np.prod(shape))*np.dtype(dtype).itemsize
+    if seed is None or isinstance(seed, np.random.Generator) or nbytes > simulation_cache.max_bytes:
+        return draw_shocks(shape, dtype=dtype, variance_reduction=variance_reduction, seed=seed, sampler=sampler)
+
+    params = dict(shape=tuple(np.atleast_1d(shape)), dtype=np.dtype(dtype).str, variance_reduction=variance_reduction, sampler=sampler)
+    key_seed = seed
+    if isinstance(seed, np.random.SeedSequence):
+        # The same entropy and spawn key always give the same stream
+        key_seed = ('SeedSequence', seed.entropy, seed.spawn_key)
+    key = SimulationCache.make_key('standard_normals', params, key_seed)
+    return simulation_cache.get_or_compute(key, lambda: draw_shocks(shape, dtype=dtype, variance_reduction=variance_reduction,
+                                                                    seed=seed, sampler=sampler))
+
+
+def child_seed(seed, *indices):
+    # An independent stream derived from seed, for drawing a second batch of shocks.
+    # The indices go in the spawn key, like SeedSequence.spawn does, since appending
+    # them to the seed itself isn't enough: SeedSequence ignores trailing zeros, so
+    # (42, 0) would be the same stream as 42.
+    if seed is None or isinstance(seed, np.random.Generator):
+        return seed
+    if isinstance(seed, np.random.SeedSequence):
+        return np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key + indices)
+    return np.random.SeedSequence(seed, spawn_key=indices)
+
+
+def step_volatilities(sigma, t, strike):
+    # sigma is either a constant volatility or a VolSurface, which is read along
+    # the given strike as a term structure of per-step forward vols
+    if hasattr(sigma, 'forward_vols'):
+        return sigma.forward_vols(strike, t)
+    return sigma
+
+
+def terminal_variance(sigma, T, strike):
+    if hasattr(sigma, 'total_variance'):
+        return float(sigma.total_variance(strike, T))
+    return sigma**2*T
+
+
+def generate_gbm_paths(s0, mu, sigma, n=24, T=30, num_paths=1000, dtype=np.float64, variance_reduction=None, surface_strike=None, seed=None, sampler=None):
+    dt = 1/n
+    t = np.linspace(0, T, n*T+1)
+    step_sigma = step_volatilities(sigma, t, s0 if surface_strike is None else surface_strike)
+    drift = np.concatenate([[0], np.cumsum(np.broadcast_to((mu-0.5*np.square(step_sigma))*dt, (n*T,)))])
+    scale = np.concatenate([[0], np.broadcast_to(step_sigma*np.sqrt(dt), (n*T,))])
+
+    # Draw every increment of every path in one shot, then turn the matrix into
+    # paths in place along the time axis so no per-path temporaries are created.
+    # Cached shocks are read-only, so scaling them is what allocates the paths.
+    with span('rng'):
+        Z = shocks((num_paths, n*T+1), dtype=dtype, variance_reduction=variance_reduction, seed=seed, sampler=sampler)
+    with span('cumsum_exp'):
+        S = np.multiply(Z, scale.astype(dtype), out=Z if Z.flags.writeable else None)
+        np.cumsum(S, axis=1, out=S)
+        S += drift.astype(dtype, copy=False)
+        np.exp(S, out=S)
+        S *= s0
+
+    return t, S
+
+
+def sample_gbm_terminal(s0, mu, sigma, T=30, num_paths=1000, dtype=np.float64, variance_reduction=None, surface_strike=None, seed=None, sampler=None):
+    # S_T is lognormal, so it can be drawn directly without building the path
+    variance = terminal_variance(sigma, T, s0 if surface_strike is None else surface_strike)
+    with span('rng'):
+        Z = shocks(num_paths, dtype=dtype, variance_reduction=variance_reduction, seed=seed, sampler=sampler)
+    with span('exp'):
+        S = np.multiply(Z, np.sqrt(variance), out=Z if Z.flags.writeable else None, dtype=dtype)
+        S += mu*T - 0.5*variance
+        np.exp(S, out=S)
+        S *= s0
+
+    return S
@@ -0,0 +1,84 @@
+import numpy as np
+
+from utils.black_scholes import black_scholes_d1_d2, norm_cdf, norm_pdf, option_sign
+
+FIRST_ORDER_GREEKS = ('delta', 'vega', 'theta', 'rho')
+SECOND_ORDER_GREEKS = ('gamma', 'vanna', 'charm', 'vomma', 'veta')
+
+
+def black_scholes_greeks(s0, strike, T, sigma, r=0.0, option_type='call'):
+    # Every first and second order Greek for whole arrays of contracts at once.
+    # Time derivatives (theta, charm, veta) are per unit of calendar time passing.
+    s0, strike, T, sigma, r = (np.asarray(x, dtype=np.float64) for x in (s0, strike, T, sigma, r))
+    w = option_sign(option_type)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sqrt_T = np.sqrt(T)
+        total_vol = sigma*sqrt_T
+        d1, d2 = black_scholes_d1_d2(s0, strike, T, sigma, r)
+        pdf_d1 = norm_pdf(d1)
+        discounted_strike = strike*np.exp(-r*T)
+        vega = s0*pdf_d1*sqrt_T
+
+        greeks = {
+            'delta': w*norm_cdf(w*d1),
+            'vega': vega,
+            'theta': -s0*pdf_d1*sigma/(2*sqrt_T) - w*r*discounted_strike*norm_cdf(w*d2),
+            'rho': w*discounted_strike*T*norm_cdf(w*d2),
+            'gamma': pdf_d1/(s0*total_vol),
+            'vanna': -pdf_d1*d2/sigma,
+            'charm': -pdf_d1*(2*r*T - d2*total_vol)/(2*T*total_vol),
+            'vomma': vega*d1*d2/sigma,
+            'veta': vega*(r*d1/total_vol - (1 + d1*d2)/(2*T)),
+        }
+
+    # With no volatility (or no time) left the payoff is certain: in the money the option
+    # is a forward on the stock, out of the money it's worth nothing, and every Greek
+    # takes that limit. Exactly at the forward there's no limit (gamma blows up), so
+    # those stay NaN.
+    zero_vol = total_vol == 0
+    if np.any(zero_vol):
+        in_the_money = w*(s0 - discounted_strike) > 0
+        away_from_forward = zero_vol & (s0 != discounted_strike)
+        limits = dict(delta=w*in_the_money, theta=-w*r*discounted_strike*in_the_money, rho=w*discounted_strike*T*in_the_money)
+        for name, value in greeks.items():
+            greeks[name] = np.where(away_from_forward, limits.get(name, 0.0), np.where(zero_vol, np.nan, value))
+    return greeks
+
+
+def monte_carlo_greeks(end_values, s0, strike, T, sigma, r=0.0, option_type='call'):
+    # Pathwise and likelihood-ratio estimators that reuse already simulated end values
+    # (drawn with drift mu = r), so no bumped resimulation is needed. strike may be an
+    # array, in which case every strike is estimated from the same paths.
+    w = option_sign(option_type)
+    strike = np.asarray(strike, dtype=np.float64)
+    S = np.asarray(end_values, dtype=np.float64).reshape((-1,) + (1,)*strike.ndim)
+    discount = np.exp(-r*T)
+    total_vol = sigma*np.sqrt(T)
+
+    # Recover the standard normal draw behind each end value
+    Z = (np.log(S/s0) - (r - 0.5*sigma**2)*T)/total_vol
+    in_the_money = w*(S - strike) > 0
+    payoffs = np.maximum(w*(S - strike), 0)
+
+    pathwise = {
+        'delta': w*discount*in_the_money*S/s0,
+        'vega': w*discount*in_the_money*S*(np.log(S/s0) - (r + 0.5*sigma**2)*T)/sigma,
+        'rho': w*discount*in_the_money*strike*T,
+        # Likelihood ratio applied to the pathwise delta, since the payoff's kink has no second derivative
+        'gamma': w*discount*in_the_money*strike*Z/(s0**2*total_vol),
+    }
+    likelihood_ratio = {
+        'delta': discount*payoffs*Z/(s0*total_vol),
+        'gamma': discount*payoffs*(Z**2 - 1 - Z*total_vol)/(s0*total_vol)**2,
+        'vega': discount*payoffs*((Z**2 - 1)/sigma - Z*np.sqrt(T)),
+    }
+
+    num_paths = S.shape[0]
+    estimates = {}
+    for method, samples in (('pathwise', pathwise), ('likelihood_ratio', likelihood_ratio)):
+        estimates[method] = {
+            greek: (values.mean(axis=0), values.std(axis=0, ddof=1)/np.sqrt(num_paths))
+            for greek, values in samples.items()
+        }
+    return estimates
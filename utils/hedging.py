@@ -0,0 +1,73 @@
+import numpy as np
+
+from utils.black_scholes import black_scholes_price, norm_cdf, norm_pdf, option_sign
+from utils.strategies import side_sign
+
+
+def delta_hedge_pnl(t, S, strike, implied_sigma, r=0.0, option_type='call', side='long', rebalance_every=1, chunk_size=5000):
+    # Hedged P&L at expiry for an option bought (or sold) at the implied vol price at
+    # t[0] and delta hedged with the stock every rebalance_every steps of the path
+    # matrix S (e.g. 1 for every step, n for once a day), cash earning r.
+    # Returns per-path arrays:
+    #   pnl: the hedged P&L
+    #   gamma_pnl: sum of 1/2*gamma*S^2*(return^2 - implied variance) over rebalances,
+    #     the part of the P&L that comes from realized vs implied volatility
+    #   realized_vol: realized vol of each path (per sqrt unit of time, like sigma)
+    # Paths are processed chunk_size rows at a time (S can be a memmap), and every
+    # rebalance of every path in a chunk is done in the same array operations.
+    t = np.asarray(t, dtype=np.float64)
+    T = t[-1] - t[0]
+    w = option_sign(option_type)
+    sign = side_sign(side)
+
+    rebalance = np.arange(0, t.size - 1, rebalance_every)
+    times = np.append(rebalance, t.size - 1)
+    dt = np.diff(t[times])
+    tau = t[-1] - t[rebalance]
+    total_vol = implied_sigma*np.sqrt(tau)
+    # Cash flows at each rebalance are carried forward to expiry
+    growth = np.exp(r*(t[-1] - t[times[1:]]))
+    carry = np.exp(r*dt)
+    # Slices rather than index arrays when the last rebalance is a whole period before
+    # expiry, so the rebalanced columns are views instead of copies
+    current = slice(0, t.size - 1, rebalance_every)
+    following = slice(rebalance_every, t.size, rebalance_every) if (t.size - 1) % rebalance_every == 0 else times[1:]
+
+    num_paths = S.shape[0]
+    results = {name: np.empty(num_paths) for name in ('pnl', 'gamma_pnl', 'realized_vol')}
+    for start in range(0, num_paths, chunk_size):
+        # S_r and S_next can be views into S, so they're never modified in place
+        chunk = np.asarray(S[start:start + chunk_size], dtype=np.float64)
+        log_S = np.log(chunk)
+        S_r, S_next = chunk[:, current], chunk[:, following]
+
+        d1 = log_S[:, current] + ((r + 0.5*implied_sigma**2)*tau - np.log(strike))
+        d1 /= total_vol
+        # The put delta is the call delta minus one
+        delta = norm_cdf(d1)
+        if w < 0:
+            delta -= 1
+        # gamma*S^2 = S*pdf(d1)/total_vol
+        gamma_S2 = norm_pdf(d1)
+        gamma_S2 *= S_r
+        gamma_S2 /= total_vol
+
+        returns = S_next/S_r
+        returns -= 1
+        np.square(returns, out=returns)
+        returns -= implied_sigma**2*dt
+        gamma_pnl = 0.5*np.einsum('ij,ij,j->i', gamma_S2, returns, growth)
+
+        moves = S_next - (S_r*carry if r != 0 else S_r)
+        hedge = np.einsum('ij,ij,j->i', delta, moves, growth)
+
+        premium = black_scholes_price(chunk[:, 0], strike, T, implied_sigma, r=r, option_type=option_type)
+        payoff = np.maximum(w*(chunk[:, -1] - strike), 0)
+
+        log_returns = np.diff(log_S, axis=1)
+        stop = start + chunk.shape[0]
+        results['pnl'][start:stop] = sign*(payoff - premium*np.exp(r*T) - hedge)
+        results['gamma_pnl'][start:stop] = sign*gamma_pnl
+        results['realized_vol'][start:stop] = np.sqrt(np.einsum('ij,ij->i', log_returns, log_returns)/T)
+
+    return results
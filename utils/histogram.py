@@ -0,0 +1,122 @@
+from statistics import NormalDist
+
+import numpy as np
+
+from utils.gbm import terminal_variance
+
+# A histogram whose bin edges are fixed before any values are seen, so chunks of
+# simulated end values can be counted as they stream in and then thrown away: the
+# histogram of any number of paths is num_bins + 2 integers. Histograms with the same
+# edges (e.g. from parallel workers) merge by adding their counts, and with edges that
+# only depend on the model parameters the bins don't jump around between reruns.
+
+
+class FixedEdgeHistogram:
+    def __init__(self, edges, strike=None):
+        self.edges = np.asarray(edges, dtype=np.float64)
+        if self.edges.ndim != 1 or self.edges.size < 2 or not np.all(np.diff(self.edges) > 0):
+            raise ValueError("edges must be at least two increasing values")
+        # counts[0] is everything below the first edge and counts[-1] everything at or
+        # above the last one, so the mass on either side of a price is never lost
+        self.counts = np.zeros(self.edges.size + 1, dtype=np.int64)
+
+        # Equal width bins are found with arithmetic instead of a search, which is
+        # several times faster. The padded edges are each slot's bounds, for checking it.
+        widths = np.diff(self.edges)
+        self.width = float(widths[0]) if np.allclose(widths, widths[0], rtol=1e-9, atol=0) else None
+        self._bounds = np.concatenate([[-np.inf], self.edges, [np.inf]])
+
+        # Values exactly on the strike are counted too, since a call doesn't pay out
+        # there but bins (closed on the left) can't tell them apart from the ones above
+        self.strike = strike
+        self.at_strike = 0
+
+    @classmethod
+    def lognormal(cls, s0, mu, sigma, T=30, num_bins=20, tail=1e-3, strike=None, surface_strike=None):
+        # Equal width bins between the tail and 1 - tail quantiles of the GBM end value,
+        # shifted so strike (if given) falls on an edge and in_the_money is exact for it
+        variance = terminal_variance(sigma, T, s0 if surface_strike is None else surface_strike)
+        log_mean = np.log(s0) + mu*T - 0.5*variance
+        z = NormalDist().inv_cdf(1 - tail)
+        low, high = np.exp(log_mean - z*np.sqrt(variance)), np.exp(log_mean + z*np.sqrt(variance))
+        if high - low < 1e-9*high:
+            # Without volatility every path ends on the same price, so (like np.histogram)
+            # the bins cover a range of 1 around it
+            low, high = np.exp(log_mean) - 0.5, np.exp(log_mean) + 0.5
+
+        width = (high - low)/num_bins
+        if strike is not None and low < strike < high:
+            low = strike - np.ceil((strike - low)/width)*width
+        return cls(low + width*np.arange(num_bins + 1), strike=strike)
+
+    @property
+    def num_bins(self):
+        return self.edges.size - 1
+
+    @property
+    def bin_counts(self):
+        # Counts of the bins themselves, without the two tails
+        return self.counts[1:-1]
+
+    @property
+    def total(self):
+        return int(self.counts.sum())
+
+    def bin_indices(self, values):
+        # 0 below the first edge, 1 to num_bins for the bins and num_bins + 1 at or above the last edge
+        if self.width is None:
+            return np.searchsorted(self.edges, values, side='right')
+        index = values - self.edges[0]
+        index /= self.width
+        np.floor(index, out=index)
+        np.clip(index, -1, self.num_bins, out=index)
+        index = index.astype(np.intp)
+        index += 1
+        # Rounding can put a value lying on an edge one bin off, so check it against
+        # the slot's bounds like np.histogram does
+        index -= values < self._bounds[index]
+        index += values >= self._bounds[index + 1]
+        return index
+
+    def update(self, values):
+        values = np.ravel(values)
+        if values.size:
+            self.counts += np.bincount(self.bin_indices(values), minlength=self.counts.size)
+            if self.strike is not None:
+                self.at_strike += int(np.count_nonzero(values == self.strike))
+        return self
+
+    def merge(self, other):
+        if not np.array_equal(self.edges, other.edges) or self.strike != other.strike:
+            raise ValueError("Only histograms with the same edges and strike can be merged")
+        self.counts += other.counts
+        self.at_strike += other.at_strike
+        return self
+
+    def mass_above(self, price):
+        # Fraction of the values at or above price. Exact when price is one of the edges,
+        # otherwise the bin it falls in is split linearly. Beyond the edges the tails are
+        # taken to sit on the edge next to them.
+        if self.total == 0:
+            return np.nan
+        slot = int(np.searchsorted(self.edges, price, side='right'))
+        above = self.counts[slot + 1:].sum()
+        if slot == 0 or price == self.edges[slot - 1]:
+            above += self.counts[slot]
+        elif slot < self.edges.size:
+            above += self.counts[slot]*(self.edges[slot] - price)/(self.edges[slot] - self.edges[slot - 1])
+        return float(above/self.total)
+
+    def in_the_money(self, strike, option_type='call'):
+        # Fraction of the end values where the option pays out: strictly below the strike
+        # for a put, and for a call strictly above the strike the histogram was built
+        # with. Ties are only counted at that strike, so at any other price a call
+        # counts the values sitting exactly on it as in the money (at or above).
+        if option_type == 'call':
+            if strike == self.strike and self.total > 0:
+                # Beyond the last edge the tail is taken to be below the strike already
+                return max(self.mass_above(strike) - self.at_strike/self.total, 0.0)
+            return self.mass_above(strike)
+        if option_type == 'put':
+            return 1 - self.mass_above(strike)
+        raise ValueError(f"option_type must be 'call' or 'put', got {option_type!r}")
@@ -0,0 +1,66 @@
+import numpy as np
+
+from utils.black_scholes import black_scholes_d1_d2, norm_pdf, option_sign, signed_black_scholes_price
+
+
+def implied_volatility(prices, s0, strike, T, r=0.0, option_type='call', tol=1e-10, max_iter=100):
+    # Inverts Black-Scholes for a whole chain at once. Each contract takes a Newton
+    # step when it stays inside its bracket and bisects otherwise, and only the
+    # contracts that haven't converged are repriced on the next iteration.
+    # Prices outside the no-arbitrage bounds come back as NaN.
+    prices, s0, strike, T, r = np.broadcast_arrays(*(np.asarray(x, dtype=np.float64) for x in (prices, s0, strike, T, r)))
+    w = np.broadcast_to(option_sign(option_type), prices.shape)
+    shape = prices.shape
+    prices, s0, strike, T, r, w = (x.ravel() for x in (prices, s0, strike, T, r, w))
+
+    discounted_strike = strike*np.exp(-r*T)
+    lower_bound = np.maximum(w*(s0 - discounted_strike), 0)
+    upper_bound = np.where(w > 0, s0, discounted_strike)
+    valid = (prices > lower_bound) & (prices < upper_bound) & (T > 0)
+
+    sigma = np.full(prices.shape, np.nan)
+    active = np.flatnonzero(valid)
+    if active.size == 0:
+        return sigma.reshape(shape)
+    target, s, k, t, rate, sign = (x[active] for x in (prices, s0, strike, T, r, w))
+
+    # Grow the upper end of the bracket until it prices above the target
+    low = np.zeros(active.size)
+    high = 1/np.sqrt(t)
+    for _ in range(64):
+        too_low = signed_black_scholes_price(s, k, t, high, rate, sign) < target
+        if not too_low.any():
+            break
+        low = np.where(too_low, high, low)
+        high = np.where(too_low, 2*high, high)
+
+    # Brenner-Subrahmanyam at-the-money approximation as the starting point
+    guess = np.sqrt(2*np.pi/t)*target/s
+    guess = np.where((guess > low) & (guess < high), guess, 0.5*(low + high))
+
+    for _ in range(max_iter):
+        diff = signed_black_scholes_price(s, k, t, guess, rate, sign) - target
+        d1, _ = black_scholes_d1_d2(s, k, t, guess, rate)
+        vega = s*norm_pdf(d1)*np.sqrt(t)
+
+        high = np.where(diff > 0, guess, high)
+        low = np.where(diff < 0, guess, low)
+
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            newton = guess - diff/vega
+        in_bracket = (newton > low) & (newton < high)
+        next_guess = np.where(in_bracket, newton, 0.5*(low + high))
+
+        done = (np.abs(diff) <= tol*np.maximum(target, 1)) | (high - low <= tol*high)
+        sigma[active[done]] = guess[done]
+
+        keep = ~done
+        if not keep.any():
+            break
+        active = active[keep]
+        target, s, k, t, rate, sign, low, high, guess = (x[keep] for x in (target, s, k, t, rate, sign, low, high, next_guess))
+    else:
+        # Whatever is left after max_iter gets its best estimate
+        sigma[active] = guess
+
+    return sigma.reshape(shape)
@@ -0,0 +1,191 @@
+import os
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from utils.gbm import BATCH_STREAM, child_seed, generate_gbm_paths, sample_gbm_terminal
+from utils.path_store import create_path_store, load_gbm_paths, save_gbm_paths
+from utils.histogram import FixedEdgeHistogram
+from utils.pricing import _price_estimate, end_value_histogram, moment_matching_batch_size, streaming_option_price
+
+# num_paths is split into one contiguous block per worker and every worker draws from
+# its own SeedSequence.spawn child, so results are bit-for-bit reproducible for a
+# given seed, worker count and chunk size. Workers write paths straight into a shared
+# memory block (or a memory-mapped file) instead of pickling arrays back to the parent.
+
+
+def _blocks(num_paths, workers):
+    bounds = np.linspace(0, num_paths, workers+1).astype(int)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _worker_streams(seed, workers):
+    # A Generator given as the seed hands out independent child streams of its own
+    if isinstance(seed, np.random.Generator):
+        return seed.bit_generator.seed_seq.spawn(workers)
+    # Same streams as SeedSequence(seed).spawn(workers), but also for a SeedSequence seed
+    return [child_seed(seed, worker) for worker in range(workers)]
+
+
+def _run_into_output(shape, dtype, worker, worker_args, seed, workers, storage=None):
+    # Workers write their blocks straight into shared memory, or into the .npy file
+    # at storage, which is then returned memory-mapped
+    workers = workers or os.cpu_count()
+    dtype = np.dtype(dtype)
+    shm = None
+    if storage is None:
+        shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape))*dtype.itemsize, 1))
+        target = ('shared_memory', shm.name)
+    else:
+        create_path_store(storage, shape, dtype=dtype).flush()
+        target = ('file', storage)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(worker, target, shape, dtype.str, start, stop, stream, *worker_args)
+                for (start, stop), stream in zip(_blocks(shape[0], workers), _worker_streams(seed, workers))
+            ]
+            for future in futures:
+                future.result()
+        if shm is None:
+            return load_gbm_paths(storage)
+        return np.ndarray(shape, dtype=dtype, buffer=shm.buf).copy()
+    finally:
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+
+
+@contextmanager
+def _attach_output(target, shape, dtype):
+    kind, name = target
+    if kind == 'file':
+        out = load_gbm_paths(name, mode='r+')
+        try:
+            yield out
+        finally:
+            out.flush()
+            del out
+        return
+
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        yield np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    finally:
+        shm.close()
+
+
+def _paths_worker(target, shape, dtype, start, stop, stream, s0, mu, sigma, n, T, variance_reduction, surface_strike, chunk_size):
+    # Written chunk_size rows at a time so a worker's memory doesn't grow with its block
+    rng = np.random.default_rng(stream)
+    with _attach_output(target, shape, dtype) as out:
+        for chunk_start in range(start, stop, chunk_size):
+            chunk_stop = min(chunk_start + chunk_size, stop)
+            _, out[chunk_start:chunk_stop] = generate_gbm_paths(s0, mu, sigma, n=n, T=T, num_paths=chunk_stop-chunk_start, dtype=dtype,
+                                                                variance_reduction=variance_reduction, surface_strike=surface_strike, seed=rng)
+
+
+def _terminal_worker(target, shape, dtype, start, stop, stream, s0, mu, sigma, T, variance_reduction, surface_strike):
+    with _attach_output(target, shape, dtype) as out:
+        out[start:stop] = sample_gbm_terminal(s0, mu, sigma, T=T, num_paths=stop-start, dtype=dtype,
+                                              variance_reduction=variance_reduction, surface_strike=surface_strike,
+                                              seed=np.random.default_rng(stream))
+
+
+def parallel_gbm_paths(s0, mu, sigma, n=24, T=30, num_paths=1000, dtype=np.float64, variance_reduction=None, surface_strike=None, seed=None, workers=None, storage=None, chunk_size=10000):
+    t = np.linspace(0, T, n*T+1)
+    S = _run_into_output((num_paths, n*T+1), dtype, _paths_worker,
+                         (s0, mu, sigma, n, T, variance_reduction, surface_strike, chunk_size), seed, workers, storage)
+    return t, S
+
+
+def parallel_gbm_terminal(s0, mu, sigma, T=30, num_paths=1000, dtype=np.float64, variance_reduction=None, surface_strike=None, seed=None, workers=None):
+    return _run_into_output((num_paths,), dtype, _terminal_worker,
+                            (s0, mu, sigma, T, variance_reduction, surface_strike), seed, workers)
+
+
+def _price_worker(stream, s0, mu, sigma, strike_value, T, option_type, batch_size, target_std_error, time_budget, max_paths, variance_reduction, num_bins):
+    rng = np.random.default_rng(stream)
+    batches = (
+        sample_gbm_terminal(s0, mu, sigma, T=T, num_paths=min(batch_size, max_paths-start), variance_reduction=variance_reduction,
+                            surface_strike=strike_value, seed=rng)
+        for start in range(0, max_paths, batch_size)
+    )
+    return streaming_option_price(batches, strike_value, option_type=option_type, target_std_error=target_std_error,
+                                  time_budget=time_budget, max_paths=max_paths, variance_reduction=variance_reduction,
+                                  expected_end_value=s0*np.exp(mu*T),
+                                  histogram=end_value_histogram(s0, mu, sigma, strike_value, T=T, num_bins=num_bins))
+
+
+def _worker_batch_size(batch_size, num_paths, variance_reduction):
+    # Moment matching estimates its error from batch means, so every worker needs
+    # several batches even when its share is smaller than one batch
+    return min(moment_matching_batch_size(batch_size, num_paths, variance_reduction), num_paths)
+
+
+def parallel_option_price(s0, mu, sigma, strike_value, T=30, option_type='call', batch_size=100000, target_std_error=None, time_budget=None, max_paths=1_000_000, confidence=0.95, variance_reduction=None, seed=None, workers=None, num_bins=None):
+    # Each worker streams its own share of max_paths at constant memory and only sends
+    # back a PriceEstimate (with its histogram, over the same edges as everyone else's).
+    # The combined estimate is the path-weighted average of the workers', so each of
+    # them only has to reach sqrt(workers) times the target error.
+    # Stopping on time_budget makes the path count (and so the result) timing dependent.
+    if max_paths is None:
+        raise ValueError("parallel_option_price needs max_paths, to split the paths between the workers")
+    workers = workers or os.cpu_count()
+    worker_target = None if target_std_error is None else target_std_error*np.sqrt(workers)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_price_worker, stream, s0, mu, sigma, strike_value, T, option_type, _worker_batch_size(batch_size, stop-start, variance_reduction),
+                        worker_target, time_budget, stop-start, variance_reduction, num_bins)
+            # Drawn from the pricer's own child of seed, like the serial pricer's batches
+            for (start, stop), stream in zip(_blocks(max_paths, workers), _worker_streams(child_seed(seed, BATCH_STREAM), workers))
+            if stop > start
+        ]
+        estimates = [future.result() for future in futures]
+    return combine_price_estimates(estimates, confidence)
+
+
+def combine_price_estimates(estimates, confidence=0.95):
+    estimates = [estimate for estimate in estimates if estimate.num_paths > 0]
+    total_paths = sum(estimate.num_paths for estimate in estimates)
+    weights = [estimate.num_paths/total_paths for estimate in estimates]
+
+    price = sum(w*estimate.price for w, estimate in zip(weights, estimates))
+    std_error = float(np.sqrt(sum((w*estimate.std_error)**2 for w, estimate in zip(weights, estimates))))
+    factor = sum(w*estimate.variance_reduction_factor for w, estimate in zip(weights, estimates))
+
+    histogram = None
+    histograms = [estimate.histogram for estimate in estimates if estimate.histogram is not None]
+    if histograms:
+        histogram = FixedEdgeHistogram(histograms[0].edges, strike=histograms[0].strike)
+        for worker_histogram in histograms:
+            histogram.merge(worker_histogram)
+    return _price_estimate(price, std_error, confidence, total_paths, factor, histogram)
+
+
+def _check_sampler(sampler, workers, storage=None):
+    # A Sobol sequence is only balanced as a whole, so it can't be split into blocks
+    # for workers or chunks written to disk
+    if sampler is not None and ((workers is not None and workers > 1) or storage is not None):
+        raise ValueError(f"sampler={sampler!r} draws every path from one sequence, so it can't be used with workers or storage")
+
+
+def gbm_paths(s0, mu, sigma, workers=None, storage=None, sampler=None, **kwargs):
+    # storage is a .npy path to keep the paths on disk (memory-mapped) instead of in RAM.
+    # Only the serial simulator takes a sampler.
+    _check_sampler(sampler, workers, storage)
+    if workers is not None and workers > 1:
+        return parallel_gbm_paths(s0, mu, sigma, workers=workers, storage=storage, **kwargs)
+    if storage is not None:
+        return save_gbm_paths(storage, s0, mu, sigma, **kwargs)
+    return generate_gbm_paths(s0, mu, sigma, sampler=sampler, **kwargs)
+
+
+def gbm_terminal(s0, mu, sigma, workers=None, sampler=None, **kwargs):
+    _check_sampler(sampler, workers)
+    if workers is not None and workers > 1:
+        return parallel_gbm_terminal(s0, mu, sigma, workers=workers, **kwargs)
+    return sample_gbm_terminal(s0, mu, sigma, sampler=sampler, **kwargs)
@@ -0,0 +1,40 @@
+import numpy as np
+
+from utils.gbm import generate_gbm_paths
+
+# Disk-backed path matrices for experiments that don't fit in RAM (1M paths at n=24,
+# T=90 is ~8 GB even as float32). Paths are stored as a plain .npy file so any
+# process can open them again with np.load(path, mmap_mode='r') without resimulating.
+# The file is column-major, so a single time step such as the end values is one
+# contiguous read instead of a strided pass over the whole file.
+
+
+def create_path_store(path, shape, dtype=np.float32):
+    return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape, fortran_order=True)
+
+
+def load_gbm_paths(path, mode='r'):
+    return np.load(path, mmap_mode=mode)
+
+
+def save_gbm_paths(path, s0, mu, sigma, n=24, T=30, num_paths=1000, dtype=np.float32, chunk_size=10000, variance_reduction=None, surface_strike=None, seed=None):
+    # Paths are simulated chunk_size rows at a time, so memory use stays at one chunk
+    # whatever num_paths is
+    t = np.linspace(0, T, n*T+1)
+    S = create_path_store(path, (num_paths, n*T+1), dtype=dtype)
+    rng = np.random.default_rng(seed)
+    for start in range(0, num_paths, chunk_size):
+        stop = min(start + chunk_size, num_paths)
+        _, S[start:stop] = generate_gbm_paths(s0, mu, sigma, n=n, T=T, num_paths=stop-start, dtype=dtype,
+                                              variance_reduction=variance_reduction, surface_strike=surface_strike, seed=rng)
+    S.flush()
+    del S
+
+    return t, load_gbm_paths(path)
+
+
+def column_batches(S, column=-1, batch_size=100000):
+    # Reads one time step of a (possibly memory-mapped) path matrix in batches, e.g.
+    # to feed the end values to streaming_option_price at constant memory
+    for start in range(0, S.shape[0], batch_size):
+        yield np.asarray(S[start:start + batch_size, column])
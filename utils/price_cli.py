@@ -0,0 +1,103 @@
+import argparse
+import csv
+import itertools
+import sys
+
+# Prices a CSV of option contracts into another CSV, a chunk of rows at a time, so
+# memory stays constant however many rows there are:
+#   python -m utils.price_cli contracts.csv prices.csv
+#   python -m utils.price_cli contracts.csv prices.csv --method monte_carlo --paths 20000 --seed 0
+# Either file can be '-' for stdin / stdout. Input columns are s0, strike, T and sigma,
+# plus optional option_type ('call' or 'put', default call) and r (default 0), in the
+# app's units: T in days and sigma, r per day. Every input column is copied to the
+# output, followed by price (and std_error for Monte Carlo).
+# Only the numerical core is imported (after the arguments are parsed), never streamlit
+# or plotly, so startup is little more than importing numpy.
+
+REQUIRED_COLUMNS = ('s0', 'strike', 'T', 'sigma')
+METHODS = ('black_scholes', 'monte_carlo')
+
+
+def checked_rows(reader, num_columns):
+    # Every row needs a value for every column. Blank lines are skipped.
+    for row in reader:
+        if not row:
+            continue
+        if len(row) != num_columns:
+            raise ValueError(f"line {reader.line_num} has {len(row)} fields but the header has {num_columns}")
+        yield row
+
+
+def read_chunks(reader, chunk_size):
+    while True:
+        rows = list(itertools.islice(reader, chunk_size))
+        if not rows:
+            return
+        yield rows
+
+
+def price_rows(rows, columns, method='black_scholes', num_paths=10000, seed=None):
+    import numpy as np
+
+    from utils.core import black_scholes_price, monte_carlo_prices
+
+    # One array per input column, converted straight from the strings
+    values = list(zip(*rows))
+    s0, strike, T, sigma = (np.array(values[columns[name]], dtype=np.float64) for name in REQUIRED_COLUMNS)
+    r = np.array(values[columns['r']], dtype=np.float64) if 'r' in columns else 0.0
+    option_type = np.array(values[columns['option_type']]) if 'option_type' in columns else 'call'
+
+    if method == 'black_scholes':
+        return (black_scholes_price(s0, strike, T, sigma, r=r, option_type=option_type),)
+    return monte_carlo_prices(s0, strike, T, sigma, r=r, option_type=option_type, num_paths=num_paths, seed=seed)
+
+
+def price_csv(source, destination, method='black_scholes', num_paths=10000, seed=None, chunk_size=100000):
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {METHODS}, got {method!r}")
+    reader = csv.reader(source)
+    writer = csv.writer(destination)
+
+    header = next(reader, None)
+    if header is None:
+        raise ValueError("the input has no header row")
+    header = [name.strip() for name in header]
+    missing = [name for name in REQUIRED_COLUMNS if name not in header]
+    if missing:
+        raise ValueError(f"the input is missing the columns {', '.join(missing)}")
+    columns = {name: index for index, name in enumerate(header)}
+    writer.writerow(header + (['price'] if method == 'black_scholes' else ['price', 'std_error']))
+
+    num_rows = 0
+    for rows in read_chunks(checked_rows(reader, len(header)), chunk_size):
+        results = price_rows(rows, columns, method=method, num_paths=num_paths, seed=seed)
+        writer.writerows(row + list(values) for row, values in zip(rows, zip(*(result.tolist() for result in results))))
+        num_rows += len(rows)
+    return num_rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m utils.price_cli', description='Price a CSV of option contracts.')
+    parser.add_argument('input', help="CSV with s0, strike, T, sigma and optionally option_type and r columns, or '-' for stdin")
+    parser.add_argument('output', help="where to write the priced CSV, or '-' for stdout")
+    parser.add_argument('--method', choices=METHODS, default='black_scholes')
+    parser.add_argument('--paths', type=int, default=10000, help='simulated paths per contract for monte_carlo')
+    parser.add_argument('--seed', type=int, help='seed for monte_carlo, for reproducible prices')
+    parser.add_argument('--chunk-size', type=int, default=100000, help='rows read, priced and written at a time')
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.input == '-' else open(args.input, newline='')
+    destination = sys.stdout if args.output == '-' else open(args.output, 'w', newline='')
+    try:
+        price_csv(source, destination, method=args.method, num_paths=args.paths, seed=args.seed, chunk_size=args.chunk_size)
+    except ValueError as error:
+        parser.error(str(error))
+    finally:
+        for f in (source, destination):
+            if f not in (sys.stdin, sys.stdout):
+                f.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
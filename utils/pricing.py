@@ -0,0 +1,182 @@
+import itertools
+import time
+from dataclasses import dataclass
+from statistics import NormalDist
+
+import numpy as np
+
+from utils.gbm import BATCH_STREAM, VARIANCE_REDUCTION_MODES, child_seed, sample_gbm_terminal
+from utils.histogram import FixedEdgeHistogram
+
+# Moment matching gives one observation per batch (its mean), so the standard error
+# rests on few numbers. The pricer doesn't stop on it before this many batch means, and
+# its interval uses a Student-t quantile.
+MIN_BATCH_MEANS = 30
+
+
+@dataclass
+class PriceEstimate:
+    price: float
+    std_error: float
+    ci_low: float
+    ci_high: float
+    confidence: float
+    num_paths: int
+    variance_reduction_factor: float = 1.0
+    # FixedEdgeHistogram of every end value used, if the pricer was asked for one
+    histogram: object = None
+
+
+class RunningStats:
+    # Welford-style running mean and variance, merged in one batch at a time
+    # (Chan et al.) so a whole chunk is folded in with array operations
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, values):
+        if values.size == 0:
+            return
+        mean = float(values.mean(dtype=np.float64))
+        m2 = float(np.square(values - mean, dtype=np.float64).sum())
+        self.merge(values.size, mean, m2)
+
+    def merge(self, count, mean, m2):
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta*count/total
+        self.m2 += m2 + delta**2*self.count*count/total
+        self.count = total
+
+    @property
+    def variance(self):
+        if self.count < 2:
+            return np.nan
+        return self.m2/(self.count-1)
+
+    @property
+    def std_error(self):
+        return float(np.sqrt(self.variance/self.count)) if self.count > 1 else np.inf
+
+
+def option_payoffs(end_values, strike_value, option_type='call'):
+    if option_type == 'call':
+        return np.maximum(end_values - strike_value, 0)
+    if option_type == 'put':
+        return np.maximum(strike_value - end_values, 0)
+    raise ValueError(f"option_type must be 'call' or 'put', got {option_type!r}")
+
+
+def gbm_terminal_batches(s0, mu, sigma, T=30, batch_size=100000, dtype=np.float64, variance_reduction=None, surface_strike=None, seed=None):
+    # With a seed, batch i always gets the same shocks from its own child stream
+    for batch in itertools.count():
+        yield sample_gbm_terminal(s0, mu, sigma, T=T, num_paths=batch_size, dtype=dtype, variance_reduction=variance_reduction,
+                                  surface_strike=surface_strike, seed=child_seed(seed, BATCH_STREAM, batch))
+
+
+def streaming_option_price(batches, strike_value, option_type='call', target_std_error=None, time_budget=None, max_paths=None, confidence=0.95, variance_reduction=None, expected_end_value=None, histogram=None):
+    # Pull batches of terminal prices until the standard error is small enough,
+    # the time budget (seconds) runs out or max_paths have been used. Every batch is
+    # also counted into histogram if one is given.
+    if target_std_error is None and time_budget is None and max_paths is None:
+        raise ValueError("At least one of target_std_error, time_budget or max_paths is needed to stop")
+    if variance_reduction not in VARIANCE_REDUCTION_MODES:
+        raise ValueError(f"variance_reduction must be one of {VARIANCE_REDUCTION_MODES}, got {variance_reduction!r}")
+    if variance_reduction == 'control_variate' and expected_end_value is None:
+        raise ValueError("The control variate needs expected_end_value, the known mean of the terminal price")
+
+    # `samples` holds the independent observations of the estimator (single payoffs,
+    # antithetic pair averages, control-variate adjusted payoffs or moment-matched
+    # batch means) while `plain` tracks the raw payoffs to measure the improvement
+    samples = RunningStats()
+    plain = RunningStats()
+    num_paths = 0
+    beta = None
+    start = time.perf_counter()
+    for end_values in batches:
+        payoffs = option_payoffs(end_values, strike_value, option_type)
+        plain.update(payoffs)
+        num_paths += payoffs.size
+        if histogram is not None:
+            histogram.update(end_values)
+
+        if variance_reduction == 'antithetic':
+            # Same pairing as standard_normals: row i is mirrored in row i + half, and
+            # with an odd batch the middle row has no partner so it's a plain sample
+            half = (payoffs.size + 1)//2
+            samples.update(0.5*(payoffs[:payoffs.size-half] + payoffs[half:]))
+            samples.update(payoffs[payoffs.size-half:half])
+        elif variance_reduction == 'control_variate':
+            if beta is None:
+                # The first batch doubles as the pilot run that fixes the coefficient
+                beta = _control_variate_beta(payoffs, end_values)
+            samples.update(payoffs - beta*(end_values - expected_end_value))
+        elif variance_reduction == 'moment_matching':
+            samples.update(np.array([payoffs.mean()]))
+        else:
+            samples.update(payoffs)
+
+        enough_samples = variance_reduction != 'moment_matching' or samples.count >= MIN_BATCH_MEANS
+        if target_std_error is not None and enough_samples and samples.std_error <= target_std_error:
+            break
+        if time_budget is not None and samples.count > 1 and time.perf_counter() - start >= time_budget:
+            break
+        if max_paths is not None and num_paths >= max_paths:
+            break
+
+    # Without any spread in the estimator (e.g. no volatility) there's nothing to compare
+    factor = plain.variance*samples.count/(num_paths*samples.variance) if samples.variance > 0 else np.nan
+    if variance_reduction is None:
+        factor = 1.0
+
+    degrees_of_freedom = samples.count - 1 if variance_reduction == 'moment_matching' else None
+    return _price_estimate(samples.mean, samples.std_error, confidence, num_paths, factor, histogram, degrees_of_freedom)
+
+
+def moment_matching_batch_size(batch_size, num_paths, variance_reduction):
+    # Small enough batches that num_paths gives at least MIN_BATCH_MEANS of them
+    if variance_reduction == 'moment_matching' and num_paths is not None:
+        return min(batch_size, max(num_paths//MIN_BATCH_MEANS, 1))
+    return batch_size
+
+
+def end_value_histogram(s0, mu, sigma, strike_value, T=30, num_bins=None):
+    # With the strike on one of the edges the in-the-money mass is counted exactly
+    if num_bins is None:
+        return None
+    return FixedEdgeHistogram.lognormal(s0, mu, sigma, T=T, num_bins=num_bins, strike=strike_value, surface_strike=strike_value)
+
+
+def price_gbm_option(s0, mu, sigma, strike_value, T=30, option_type='call', batch_size=100000, target_std_error=None, time_budget=None, max_paths=None, confidence=0.95, variance_reduction=None, seed=None, num_bins=None):
+    # A volatility surface is read at the option's own strike. With num_bins the
+    # estimate also carries a histogram of the end values.
+    batch_size = moment_matching_batch_size(batch_size, max_paths, variance_reduction)
+    batches = gbm_terminal_batches(s0, mu, sigma, T=T, batch_size=batch_size, variance_reduction=variance_reduction,
+                                   surface_strike=strike_value, seed=seed)
+    return streaming_option_price(batches, strike_value, option_type=option_type, target_std_error=target_std_error,
+                                  time_budget=time_budget, max_paths=max_paths, confidence=confidence,
+                                  variance_reduction=variance_reduction, expected_end_value=s0*np.exp(mu*T),
+                                  histogram=end_value_histogram(s0, mu, sigma, strike_value, T=T, num_bins=num_bins))
+
+
+def _control_variate_beta(payoffs, end_values):
+    end_variance = end_values.var(dtype=np.float64)
+    if end_variance == 0:
+        return 0.0
+    covariance = np.mean((payoffs - payoffs.mean())*(end_values - end_values.mean()), dtype=np.float64)
+    return float(covariance/end_variance)
+
+
+def _price_estimate(price, std_error, confidence, num_paths, variance_reduction_factor=1.0, histogram=None, degrees_of_freedom=None):
+    # degrees_of_freedom is set when std_error comes from a handful of batch or
+    # replication means, where the normal quantile would make the interval too narrow
+    if degrees_of_freedom is None:
+        quantile = NormalDist().inv_cdf(0.5 + confidence/2)
+    else:
+        from scipy.stats import t as student_t
+        quantile = float(student_t.ppf(0.5 + confidence/2, max(degrees_of_freedom, 1)))
+    half_width = quantile*std_error
+    return PriceEstimate(price=price, std_error=std_error, ci_low=price - half_width, ci_high=price + half_width,
+                         confidence=confidence, num_paths=num_paths, variance_reduction_factor=float(variance_reduction_factor),
+                         histogram=histogram)
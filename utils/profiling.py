@@ -0,0 +1,182 @@
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+
+import numpy as np
+
+# Timing spans for page reruns. Streamlit runs each session's script on its own
+# thread, so the rerun being recorded is kept thread-local and spans opened anywhere
+# below it (page sections, simulator stages, chart serialization) land in the right
+# session's profile. With no rerun being recorded, span() and record_figure() do nothing.
+
+_local = threading.local()
+
+
+@dataclass
+class Span:
+    # path is the name prefixed by the spans it's nested in, e.g. 'Playground/simulate_gbm_end_values/rng'
+    name: str
+    path: str
+    depth: int
+    start: float
+    seconds: float
+
+
+@dataclass
+class RerunProfile:
+    # scope is 'app' for a full rerun, or the fragment's name when only a fragment reran
+    session: str
+    started_at: float
+    scope: str = 'app'
+    seconds: float = 0.0
+    spans: list = field(default_factory=list)
+    figures: list = field(default_factory=list)
+
+    def section_seconds(self):
+        # Time per top level span, in page order
+        return {span.name: span.seconds for span in self.spans if span.depth == 0}
+
+    def to_json(self):
+        return json.dumps(asdict(self))
+
+
+class _Recorder:
+    def __init__(self, profile):
+        self.profile = profile
+        self.start = time.perf_counter()
+        # (name, start, is_section) for every open span, outermost first
+        self.stack = []
+
+    def open(self, name, is_section=False):
+        self.stack.append((name, time.perf_counter(), is_section))
+
+    def close(self):
+        now = time.perf_counter()
+        path = '/'.join(item[0] for item in self.stack)
+        name, start, _ = self.stack.pop()
+        self.profile.spans.append(Span(name, path, len(self.stack), start - self.start, now - start))
+
+    def close_to(self, depth):
+        while len(self.stack) > depth:
+            self.close()
+
+
+class RerunProfiler:
+    # Keeps the profiles of one session's last max_reruns reruns, and appends every
+    # finished profile to log_path as a line of JSON if it's set, so logs from many
+    # sessions can be aggregated later with load_profiles and summarize_spans.
+    # enabled is whether the page wants its reruns recorded, which fragment() needs
+    # to know when a fragment reruns on its own.
+    def __init__(self, session='', max_reruns=10, log_path=None):
+        self.session = session
+        self.log_path = log_path
+        self.history = deque(maxlen=max_reruns)
+        self.enabled = False
+
+    def start(self, scope='app'):
+        # A rerun that was interrupted before finish() is simply dropped
+        _local.recorder = _Recorder(RerunProfile(self.session, time.time(), scope))
+
+    def finish(self):
+        recorder = getattr(_local, 'recorder', None)
+        _local.recorder = None
+        if recorder is None:
+            return None
+        recorder.close_to(0)
+        profile = recorder.profile
+        profile.seconds = time.perf_counter() - recorder.start
+        # Spans are appended as they close, so put them back in the order they started
+        profile.spans.sort(key=lambda span: span.start)
+
+        self.history.append(profile)
+        if self.log_path:
+            with open(self.log_path, 'a') as f:
+                f.write(profile.to_json() + '\n')
+        return profile
+
+    @contextmanager
+    def fragment(self, name):
+        # Inside a full rerun a fragment is just a span. When only the fragment reruns
+        # nothing else is running, so it's recorded as a profile of its own.
+        if getattr(_local, 'recorder', None) is not None or not self.enabled:
+            with span(name):
+                yield
+            return
+        self.start(scope=name)
+        try:
+            with span(name):
+                yield
+        finally:
+            self.finish()
+
+    def export_jsonl(self):
+        return ''.join(profile.to_json() + '\n' for profile in self.history)
+
+
+@contextmanager
+def span(name):
+    recorder = getattr(_local, 'recorder', None)
+    if recorder is None:
+        yield
+        return
+    depth = len(recorder.stack)
+    recorder.open(name)
+    try:
+        yield
+    finally:
+        # Also ends any sections started inside the span
+        recorder.close_to(depth)
+
+
+def section(name):
+    # Ends the current section (if any) and starts the next one, so a linear script
+    # can be split into sections with one call at the top of each. Sections started
+    # inside a span (e.g. a fragment) are nested in it and end with it.
+    recorder = getattr(_local, 'recorder', None)
+    if recorder is None:
+        return
+    if recorder.stack and recorder.stack[-1][2]:
+        recorder.close()
+    recorder.open(name, is_section=True)
+
+
+def record_figure(name, fig):
+    # The payload size is what st.plotly_chart sends to the browser. Measuring it
+    # serializes the figure a second time, so it's only done while recording.
+    recorder = getattr(_local, 'recorder', None)
+    if recorder is None:
+        return
+    with span('figure_json'):
+        num_bytes = len(fig.to_json())
+    recorder.profile.figures.append((name, num_bytes))
+
+
+def load_profiles(path):
+    profiles = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                record['spans'] = [Span(**item) for item in record['spans']]
+                record['figures'] = [tuple(item) for item in record['figures']]
+                profiles.append(RerunProfile(**record))
+    return profiles
+
+
+def summarize_spans(profiles):
+    # Per span path: how many times it ran and its mean, median, 95th percentile and
+    # worst time in seconds, across all the given profiles (e.g. every session's log)
+    times = {}
+    for profile in profiles:
+        times.setdefault('rerun', []).append(profile.seconds)
+        for item in profile.spans:
+            times.setdefault(item.path, []).append(item.seconds)
+    summary = {}
+    for path, seconds in times.items():
+        seconds = np.array(seconds)
+        summary[path] = dict(count=seconds.size, mean=float(seconds.mean()), median=float(np.median(seconds)),
+                             p95=float(np.percentile(seconds, 95)), max=float(seconds.max()))
+    return summary
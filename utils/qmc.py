@@ -0,0 +1,111 @@
+import numpy as np
+
+from utils.gbm import generate_gbm_paths, sample_gbm_terminal
+from utils.pricing import RunningStats, _price_estimate, option_payoffs
+
+# Quasi-Monte Carlo for the GBM engine: scrambled Sobol points instead of pseudo-random
+# draws, which for smooth payoffs shrinks the error close to 1/N instead of 1/sqrt(N).
+# The simulators take sampler='sobol' to get their shocks from sobol_shocks, and build
+# the paths from them like any other shocks.
+# Sobol points need direction numbers for every dimension (one per time step here), so
+# this uses scipy's generator, imported when it's first needed so pages that don't use
+# QMC don't pay for loading scipy. num_paths should be a power of two to keep the
+# points balanced.
+
+
+def sobol_normals(num_paths, dims, seed=None):
+    # (num_paths, dims) standard normals from one randomly scrambled Sobol sequence
+    from scipy.special import ndtri
+    from scipy.stats import qmc
+
+    sampler = qmc.Sobol(d=dims, scramble=True, seed=np.random.default_rng(seed))
+    U = sampler.random(num_paths)
+    # Scrambled points are never exactly 0 or 1, but guard the inverse CDF anyway
+    np.clip(U, np.finfo(np.float64).tiny, 1 - np.finfo(np.float64).epsneg, out=U)
+    return ndtri(U)
+
+
+def brownian_bridge_schedule(num_steps):
+    # The order in which a bridge fills in the num_steps points of a path: the last
+    # point first, then the midpoints of the gaps, each from its two known neighbours
+    # (index -1 stands for the start of the path at 0). Returns per construction step
+    # (point, left neighbour, right neighbour), with right = -1 for the first one.
+    schedule = [(num_steps - 1, -1, -1)]
+    gaps = [(0, num_steps - 1)]
+    while gaps:
+        next_gaps = []
+        for left, right in gaps:
+            # left is the first unknown point of the gap, right its known right neighbour
+            if left >= right:
+                continue
+            point = left + (right - 1 - left)//2
+            schedule.append((point, left - 1, right))
+            next_gaps += [(left, point), (point + 1, right)]
+        gaps = next_gaps
+    return np.array(schedule)
+
+
+def brownian_bridge(Z, t):
+    # Turns normals Z (num_paths, num_steps) into Brownian motion at the times t[1:],
+    # with column 0 of Z setting the end point, the next columns the midpoints and so
+    # on, so the first Sobol dimensions (the best distributed ones) carry the most variance.
+    # Every construction step is one operation across all paths.
+    t = np.asarray(t, dtype=np.float64)
+    times = t[1:] - t[0]
+    num_steps = times.size
+    W = np.empty((num_steps, Z.shape[0]))
+    Z = Z.T
+
+    for k, (point, left, right) in enumerate(brownian_bridge_schedule(num_steps)):
+        if right < 0:
+            W[point] = np.sqrt(times[point])*Z[k]
+            continue
+        t_left = times[left] if left >= 0 else 0.0
+        t_point, t_right = times[point], times[right]
+        right_weight = (t_point - t_left)/(t_right - t_left)
+        std = np.sqrt((t_point - t_left)*(t_right - t_point)/(t_right - t_left))
+        W[point] = right_weight*W[right] + std*Z[k]
+        if left >= 0:
+            W[point] += (1 - right_weight)*W[left]
+
+    return W.T
+
+
+def sobol_shocks(shape, dtype=np.float64, seed=None):
+    # Sobol counterpart of standard_normals. A 1-D shape (terminal values) gets one
+    # dimension. A (num_paths, num_points) path matrix gets Brownian bridge increments,
+    # scaled to unit variance per step, in columns 1 onwards, while column 0 (the start
+    # of the path, which generate_gbm_paths scales by 0) stays 0.
+    shape = tuple(np.atleast_1d(shape))
+    if len(shape) == 1:
+        return sobol_normals(shape[0], 1, seed=seed)[:, 0].astype(dtype)
+    num_paths, num_points = shape
+    Z = np.zeros(shape, dtype=dtype)
+    if num_points > 1:
+        # Steps are equally spaced, so the bridge can run on unit time steps
+        W = brownian_bridge(sobol_normals(num_paths, num_points - 1, seed=seed), np.arange(num_points))
+        Z[:, 1:] = np.diff(W, axis=1, prepend=0)
+    return Z
+
+
+def qmc_option_price(s0, mu, sigma, strike_value, T=30, option_type='call', num_paths=1024, replications=16, n=None, confidence=0.95, seed=None):
+    # Randomized QMC: the price is averaged over independently scrambled replications,
+    # and the spread between them gives the standard error (a single Sobol sequence
+    # has no usable error estimate of its own). With n set the payoff is taken from
+    # bridged paths with n steps per day instead of sampling S_T directly.
+    means = RunningStats()
+    plain = RunningStats()
+    for stream in np.random.SeedSequence(seed).spawn(replications):
+        if n is None:
+            end_values = sample_gbm_terminal(s0, mu, sigma, T=T, num_paths=num_paths, surface_strike=strike_value, seed=stream, sampler='sobol')
+        else:
+            end_values = generate_gbm_paths(s0, mu, sigma, n=n, T=T, num_paths=num_paths, surface_strike=strike_value, seed=stream,
+                                            sampler='sobol')[1][:, -1]
+        payoffs = option_payoffs(end_values, strike_value, option_type)
+        plain.update(payoffs)
+        means.update(np.array([payoffs.mean()]))
+
+    total_paths = num_paths*replications
+    # Without any spread between replications (e.g. no volatility) there's nothing to compare
+    factor = plain.variance/(total_paths*means.variance/replications) if means.variance > 0 else np.nan
+    return _price_estimate(means.mean, means.std_error, confidence, total_paths, factor, degrees_of_freedom=replications - 1)
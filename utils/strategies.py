@@ -0,0 +1,146 @@
+import numpy as np
+
+from utils.black_scholes import option_sign
+
+# A leg is stored as signs and numbers only, so a strategy is one small structured
+# array and a batch of strategies is a 2-D one (padded with zero-quantity legs).
+# option_type is +1 for a call and -1 for a put, side is +1 long and -1 short, and
+# premium is the price paid (or received) per option.
+LEG_DTYPE = np.dtype([('option_type', np.int8), ('side', np.int8), ('strike', np.float64),
+                      ('premium', np.float64), ('quantity', np.float64)])
+
+
+def side_sign(side):
+    side = np.asarray(side)
+    is_long = side == 'long'
+    if not np.all(is_long | (side == 'short')):
+        raise ValueError("side must be 'long' or 'short'")
+    return np.where(is_long, 1, -1)
+
+
+def make_legs(option_types, sides, strikes, premiums=0.0, quantities=1.0):
+    option_types, sides, strikes, premiums, quantities = np.broadcast_arrays(
+        option_sign(option_types), side_sign(sides), np.asarray(strikes, dtype=np.float64), premiums, quantities)
+    legs = np.empty(strikes.shape, dtype=LEG_DTYPE)
+    legs['option_type'] = option_types
+    legs['side'] = sides
+    legs['strike'] = strikes
+    legs['premium'] = premiums
+    legs['quantity'] = quantities
+    return legs
+
+
+def stack_strategies(strategies):
+    # One row per strategy, with shorter strategies padded by legs that have no quantity
+    legs = [strategy.legs if isinstance(strategy, Strategy) else np.asarray(strategy, dtype=LEG_DTYPE) for strategy in strategies]
+    stacked = np.zeros((len(legs), max(leg.size for leg in legs)), dtype=LEG_DTYPE)
+    stacked['option_type'] = 1
+    stacked['side'] = 1
+    for row, leg in zip(stacked, legs):
+        row[:leg.size] = leg
+    return stacked
+
+
+def net_premium(legs):
+    # What it costs to open the position (negative for a net credit)
+    return np.sum(legs['side']*legs['quantity']*legs['premium'], axis=-1)
+
+
+def strategy_payoffs(legs, prices):
+    # Expiry value of every strategy (legs of shape (..., num_legs)) at every price,
+    # shape (..., *prices.shape).
+    # Puts are rewritten as calls minus a forward, max(K-S, 0) = max(S-K, 0) - (S-K),
+    # and a sum of calls is S*A(S) - B(S) where A and B are the sums of q and q*K over
+    # the strikes below S. A and B are step functions of S, so they're built with one
+    # scatter of every leg onto the grid and a cumulative sum, instead of one
+    # broadcasted pass over strategies x prices per leg.
+    legs = np.asarray(legs, dtype=LEG_DTYPE)
+    prices = np.asarray(prices, dtype=np.float64)
+    if legs.ndim == 0:
+        legs = legs[None]
+    batch_shape, legs = legs.shape[:-1], legs.reshape(-1, legs.shape[-1])
+
+    order = np.argsort(prices.ravel(), kind='stable')
+    sorted_prices = prices.ravel()[order]
+    num_strategies, num_prices = legs.shape[0], prices.size
+
+    q = legs['side']*legs['quantity']
+    strike = legs['strike']
+    is_put = legs['option_type'] < 0
+    forward_slope = -np.sum(q*is_put, axis=-1)
+    forward_intercept = np.sum(q*strike*is_put, axis=-1)
+
+    position = np.searchsorted(sorted_prices, strike, side='right') + (num_prices + 1)*np.arange(num_strategies)[:, None]
+    A = np.bincount(position.ravel(), weights=q.ravel(), minlength=num_strategies*(num_prices + 1))
+    B = np.bincount(position.ravel(), weights=(q*strike).ravel(), minlength=num_strategies*(num_prices + 1))
+    A = np.cumsum(A.reshape(num_strategies, num_prices + 1), axis=1, out=A.reshape(num_strategies, num_prices + 1))[:, :-1]
+    B = np.cumsum(B.reshape(num_strategies, num_prices + 1), axis=1, out=B.reshape(num_strategies, num_prices + 1))[:, :-1]
+
+    A += forward_slope[:, None]
+    B -= forward_intercept[:, None]
+    payoffs = np.multiply(A, sorted_prices, out=A)
+    payoffs -= B
+
+    if np.any(order != np.arange(num_prices)):
+        payoffs[:, order] = payoffs.copy()
+    return payoffs.reshape(batch_shape + prices.shape)
+
+
+def strategy_profits(legs, prices):
+    prices = np.asarray(prices, dtype=np.float64)
+    profits = strategy_payoffs(legs, prices)
+    profits -= np.reshape(net_premium(legs), np.shape(net_premium(legs)) + (1,)*prices.ndim)
+    return profits
+
+
+class Strategy:
+    # A combination of call and put legs on one underlying, all expiring together
+    def __init__(self, legs):
+        self.legs = np.atleast_1d(np.asarray(legs, dtype=LEG_DTYPE))
+
+    @classmethod
+    def from_legs(cls, *legs):
+        # Each leg is (option_type, side, strike[, premium[, quantity]]), e.g. ('call', 'short', 54.2, 1.1, 2)
+        return cls(np.concatenate([make_legs(*leg).reshape(1) for leg in legs]))
+
+    @classmethod
+    def single(cls, option_type, side, strike, premium=0.0, quantity=1.0):
+        return cls.from_legs((option_type, side, strike, premium, quantity))
+
+    @classmethod
+    def butterfly(cls, center, width, premiums=(0.0, 0.0, 0.0), option_type='call'):
+        # Long the wings one width either side, short two at the center
+        lower, middle, upper = premiums
+        return cls.from_legs((option_type, 'long', center - width, lower),
+                             (option_type, 'short', center, middle, 2),
+                             (option_type, 'long', center + width, upper))
+
+    @classmethod
+    def condor(cls, strikes, premiums=(0.0, 0.0, 0.0, 0.0), option_type='call'):
+        # Long the outer two strikes, short the inner two
+        sides = ('long', 'short', 'short', 'long')
+        return cls.from_legs(*[(option_type, side, strike, premium) for side, strike, premium in zip(sides, sorted(strikes), premiums)])
+
+    def __add__(self, other):
+        return Strategy(np.concatenate([self.legs, other.legs]))
+
+    def __len__(self):
+        return self.legs.size
+
+    def __str__(self):
+        # e.g. "long 1 call @ 53.2, short 2 calls @ 54.2, long 1 call @ 55.2"
+        return ', '.join(
+            f"{'long' if leg['side'] > 0 else 'short'} {leg['quantity']:g} {'call' if leg['option_type'] > 0 else 'put'}"
+            f"{'' if leg['quantity'] == 1 else 's'} @ {leg['strike']:g}"
+            for leg in self.legs
+        )
+
+    @property
+    def net_premium(self):
+        return float(net_premium(self.legs))
+
+    def payoff(self, prices):
+        return strategy_payoffs(self.legs, prices)
+
+    def profit(self, prices):
+        return strategy_profits(self.legs, prices)
@@ -0,0 +1,151 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from utils.black_scholes import black_scholes_price
+from utils.strategies import LEG_DTYPE, Strategy, make_legs, strategy_payoffs
+
+OBJECTIVES = ('expected_profit', 'payoff_at_target')
+
+
+@dataclass
+class SearchResult:
+    strategy: Strategy
+    score: float
+    net_premium: float
+    max_loss: float
+
+
+def leg_universe(strikes, call_premiums, put_premiums):
+    # One leg per (type, side, strike): long calls, short calls, long puts, short puts,
+    # each block running over the whole strike ladder
+    strikes = np.asarray(strikes, dtype=np.float64)
+    option_types = np.repeat(['call', 'call', 'put', 'put'], strikes.size)
+    sides = np.repeat(['long', 'short', 'long', 'short'], strikes.size)
+    premiums = np.concatenate([call_premiums, call_premiums, put_premiums, put_premiums])
+    return make_legs(option_types, sides, np.tile(strikes, 4), premiums)
+
+
+def model_leg_universe(s0, strikes, T, sigma, r=0.0):
+    # Leg universe priced with Black-Scholes, in the simulators' units
+    strikes = np.asarray(strikes, dtype=np.float64)
+    return leg_universe(strikes, black_scholes_price(s0, strikes, T, sigma, r=r, option_type='call'),
+                        black_scholes_price(s0, strikes, T, sigma, r=r, option_type='put'))
+
+
+def search_strategies(legs, prices, probabilities=None, objective='expected_profit', target_price=None, max_legs=4, budget=None, max_loss=None, bounded_loss=True, top_n=5, beam_width=20000):
+    # Finds the top_n combinations of up to max_legs legs (repeats allowed, so "short
+    # two calls" is one leg taken twice) that maximise the objective under a target
+    # terminal distribution, given as samples in prices or as prices with probabilities.
+    #   expected_profit: expected payoff under the distribution minus the net premium
+    #   payoff_at_target: payoff if the stock ends exactly at target_price minus the net premium
+    # budget caps the net premium paid, max_loss caps the worst loss at expiry, and
+    # bounded_loss rules out positions that lose without limit as the price rises.
+    #
+    # Everything a combination is judged on (score, net premium, net calls and the
+    # payoff at each strike) is a sum over its legs, so combinations are grown one leg
+    # at a time by adding per-leg vectors, for a whole level of candidates at once.
+    # Legs are only appended in index order, so each multiset is built once, and a
+    # candidate is dropped as soon as no completion of it can still be feasible or
+    # beat the current top_n. beam_width caps how many candidates go on to the next level.
+    if objective not in OBJECTIVES:
+        raise ValueError(f"objective must be one of {OBJECTIVES}, got {objective!r}")
+    if objective == 'payoff_at_target' and target_price is None:
+        raise ValueError("payoff_at_target needs a target_price")
+
+    legs = np.asarray(legs, dtype=LEG_DTYPE)
+    cost = legs['side']*legs['quantity']*legs['premium']
+    calls = legs['side']*legs['quantity']*(legs['option_type'] > 0)
+    if objective == 'expected_profit':
+        payoffs = strategy_payoffs(legs[:, None], prices)
+        if probabilities is None:
+            expected = payoffs.mean(axis=1)
+        else:
+            probabilities = np.asarray(probabilities, dtype=np.float64)
+            expected = payoffs @ (probabilities/probabilities.sum())
+        score = expected - cost
+    else:
+        score = strategy_payoffs(legs[:, None], target_price) - cost
+
+    # With no net short calls the payoff is piecewise linear and flat or rising past
+    # the last strike, so its minimum is at zero or at one of the strikes
+    kinks = np.concatenate([[0.0], np.unique(legs['strike'])])
+    kink_payoffs = strategy_payoffs(legs[:, None], kinks)
+
+    opposite = _opposite_legs(legs)
+    best_possible = np.maximum.accumulate(np.maximum(score, 0)[::-1])[::-1]
+    most_calls = max(calls.max(), 0)
+    cheapest = min(cost.min(), 0)
+
+    frontier = (np.arange(legs.size)[:, None], score, cost, calls, kink_payoffs)
+    results = []
+    for level in range(1, max_legs + 1):
+        idx, f_score, f_cost, f_calls, f_kinks = frontier
+        loss = np.where(f_calls >= 0, f_cost - f_kinks.min(axis=1), np.inf)
+        feasible = np.ones(idx.shape[0], dtype=bool)
+        if budget is not None:
+            feasible &= f_cost <= budget
+        if bounded_loss:
+            feasible &= f_calls >= 0
+        if max_loss is not None:
+            feasible &= loss <= max_loss
+        results = _best_results(results, idx[feasible], f_score[feasible], f_cost[feasible], loss[feasible], top_n)
+
+        if level == max_legs or idx.shape[0] == 0:
+            break
+        threshold = results[-1][1] if len(results) == top_n else -np.inf
+        remaining = max_legs - level - 1
+        frontier = _expand(frontier, score, cost, calls, kink_payoffs, opposite, best_possible, most_calls, cheapest,
+                           remaining, threshold, budget, bounded_loss, beam_width)
+
+    return [_search_result(legs, *result) for result in results]
+
+
+def _opposite_legs(legs):
+    # Index of the leg that cancels each leg out (same type and strike, other side)
+    keys = {(t, s, k): i for i, (t, s, k) in enumerate(zip(legs['option_type'], legs['side'], legs['strike']))}
+    return np.array([keys.get((t, -s, k), -1) for t, s, k in zip(legs['option_type'], legs['side'], legs['strike'])])
+
+
+def _expand(frontier, score, cost, calls, kink_payoffs, opposite, best_possible, most_calls, cheapest, remaining, threshold, budget, bounded_loss, beam_width, chunk_size=5000):
+    idx, f_score, f_cost, f_calls, f_kinks = frontier
+    num_legs = score.size
+    kept_rows, kept_legs, kept_score = np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), np.empty(0)
+
+    for start in range(0, idx.shape[0], chunk_size):
+        rows = np.arange(start, min(start + chunk_size, idx.shape[0]))
+        child_score = f_score[rows, None] + score
+        keep = np.arange(num_legs) >= idx[rows, -1, None]
+        for column in idx[rows].T:
+            keep &= opposite != column[:, None]
+        # Even the best remaining legs can't lift this past the current top results
+        keep &= child_score + remaining*best_possible > threshold
+        if bounded_loss:
+            keep &= f_calls[rows, None] + calls + remaining*most_calls >= 0
+        if budget is not None:
+            keep &= f_cost[rows, None] + cost + remaining*cheapest <= budget
+
+        child_rows, child_legs = np.nonzero(keep)
+        kept_rows = np.concatenate([kept_rows, rows[child_rows]])
+        kept_legs = np.concatenate([kept_legs, child_legs])
+        kept_score = np.concatenate([kept_score, child_score[child_rows, child_legs]])
+        if kept_score.size > beam_width:
+            top = np.argpartition(-kept_score, beam_width)[:beam_width]
+            kept_rows, kept_legs, kept_score = kept_rows[top], kept_legs[top], kept_score[top]
+
+    return (np.column_stack([idx[kept_rows], kept_legs]), kept_score, f_cost[kept_rows] + cost[kept_legs],
+            f_calls[kept_rows] + calls[kept_legs], f_kinks[kept_rows] + kink_payoffs[kept_legs])
+
+
+def _best_results(results, idx, score, cost, loss, top_n):
+    order = np.argsort(-score, kind='stable')[:top_n]
+    results = results + [(tuple(idx[i]), float(score[i]), float(cost[i]), float(loss[i])) for i in order]
+    return sorted(results, key=lambda result: -result[1])[:top_n]
+
+
+def _search_result(legs, idx, score, net_premium, max_loss):
+    # Repeated legs are folded into a single leg with a larger quantity
+    unique, counts = np.unique(idx, return_counts=True)
+    strategy_legs = legs[unique].copy()
+    strategy_legs['quantity'] *= counts
+    return SearchResult(Strategy(strategy_legs), score, net_premium, max_loss)
@@ -1,69 +1,129 @@
+from functools import partial, wraps
+
 import streamlit as st
 import numpy as np
-import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
-def calculate_long_call_payoff(underlying_prices, strike_price, premium):
-    payoffs = np.where(underlying_prices <= strike_price, -premium, (underlying_prices - strike_price) - premium)
-    return payoffs
-
-def calculate_long_put_payoff(underlying_prices, strike_price, premium):
-    put_payoffs = np.where(underlying_prices <= strike_price, (strike_price - underlying_prices) - premium, -premium)
-    return put_payoffs
+from utils.american import binomial_american_price, longstaff_schwartz_price
+from utils.black_scholes import black_scholes_price
+from utils.cache import SimulationCache, simulation_cache
+# The numerical core lives in utils.core, these are re-exported for the page
+from utils.core import calculate_long_call_payoff, calculate_long_put_payoff, fair_price
+from utils.gbm import TERMINAL_STREAM, child_seed, generate_gbm_paths
+from utils.greeks import FIRST_ORDER_GREEKS, SECOND_ORDER_GREEKS, black_scholes_greeks, monte_carlo_greeks
+from utils.hedging import delta_hedge_pnl
+from utils.histogram import FixedEdgeHistogram
+from utils.parallel import gbm_paths, gbm_terminal, parallel_option_price
+from utils.pricing import price_gbm_option
+from utils.profiling import record_figure, span
+from utils.qmc import qmc_option_price
 
 def roll_dice():
     return np.random.randint(1, 7)
 
-def simulate_gbm_paths(s0, mu, sigma, n=24, T=30, num_paths=1000, plot=True):
-    dt = 1/n
-    t = np.linspace(0, T, n*T+1)
-    S = np.zeros((num_paths, n*T+1))
-    
-    for i in range(num_paths):
-        W = np.random.standard_normal(size=n*T+1)
-        W = np.cumsum(W)*np.sqrt(dt)
-        X = (mu-0.5*sigma**2)*t + sigma*W
-        S[i,:] = s0*np.exp(X)
-        
-        
+def pack_paths(t, S, max_display_paths=None):
+    # Every path goes into a single line with a NaN after each path so the
+    # lines don't join up. Subsampling only thins out what gets drawn, and values
+    # are rounded for display to keep the figure JSON small.
+    if max_display_paths is not None and S.shape[0] > max_display_paths:
+        S = S[np.linspace(0, S.shape[0]-1, max_display_paths).astype(int)]
+    num_paths, num_steps = S.shape
+
+    x = np.empty((num_paths, num_steps+1))
+    x[:, :-1] = np.round(t, 4)
+    x[:, -1] = np.nan
+    y = np.empty((num_paths, num_steps+1), dtype=S.dtype)
+    np.round(S, 3, out=y[:, :-1])
+    y[:, -1] = np.nan
+
+    return x.ravel(), y.ravel()
+
+def add_paths_trace(fig, t, S, max_display_paths=None, packed_paths=None, **position):
+    # All paths are drawn as one WebGL trace
+    x, y = pack_paths(t, S, max_display_paths) if packed_paths is None else packed_paths
+    fig.add_trace(go.Scattergl(x=x, y=y, mode='lines', line=dict(width=1), opacity=0.6, name='Paths'), **position)
+    return fig
+
+def plotly_chart(fig, name=None):
+    # st.plotly_chart with the serialization timed, and the payload size recorded, while profiling
+    record_figure(name or fig.layout.title.text or 'figure', fig)
+    with span('plotly_chart'):
+        st.plotly_chart(fig)
+
+def timed_fragment(name):
+    # st.fragment, so widgets inside only rerun the decorated section, that's also timed
+    # by the session's profiler: as a span of a full rerun, or as a profile of its own
+    # when only the fragment reruns
+    def decorate(function):
+        @wraps(function)
+        def run(*args, **kwargs):
+            profiler = st.session_state.get('profiler')
+            if profiler is None:
+                return function(*args, **kwargs)
+            with profiler.fragment(name):
+                return function(*args, **kwargs)
+        return st.fragment(run)
+    return decorate
+
+def cached_simulation(simulator, params, build, use_cache=False):
+    # Identical reruns (from any session) reuse the stored result instead of simulating again
+    with span(simulator):
+        if not use_cache:
+            return build(**params)
+        key = SimulationCache.make_key(simulator, params, params.get('seed'))
+        return simulation_cache.get_or_compute(key, lambda: build(**params))
+
+def build_gbm_paths_figure(s0, mu, sigma, n=24, T=30, num_paths=1000, dtype=np.float64, variance_reduction=None, max_display_paths=None, seed=None, workers=None, storage=None, sampler=None):
+    t, S = gbm_paths(s0, mu, sigma, n=n, T=T, num_paths=num_paths, dtype=dtype, variance_reduction=variance_reduction, seed=seed, workers=workers, storage=storage, sampler=sampler)
+    with span('figure'):
+        return gbm_paths_figure(t, S, max_display_paths=max_display_paths)
+
+def gbm_paths_figure(t, S, max_display_paths=None):
     fig_paths = go.Figure()
-    for i in range(num_paths):
-        fig_paths.add_trace(go.Scatter(x=t, y=S[i,:], mode='lines', name=f'Path {i+1}'))
+    add_paths_trace(fig_paths, t, S, max_display_paths=max_display_paths)
 
     fig_paths.update_layout(
         title='Simulated Stock Paths',
         xaxis_title='Time',
         yaxis_title='Price',
-        showlegend=True,
+        showlegend=False,
         width=800,
         height=500,
     )
-    if plot:
-        st.plotly_chart(fig_paths)
-def simulate_gbm_paths_plotly_histogram_with_bins(s0, mu, sigma, n=24, T=30, num_paths=1000, num_bins=20):
-    dt = 1/n
-    t = np.linspace(0, T, n*T+1)
-    S = np.zeros((num_paths, n*T+1))
-    
-    for i in range(num_paths):
-        W = np.random.standard_normal(size=n*T+1)
-        W = np.cumsum(W)*np.sqrt(dt)
-        X = (mu-0.5*sigma**2)*t + sigma*W
-        S[i,:] = s0*np.exp(X)
-    
-    # Calculate end values
-    end_values = S[:, -1]
-    
-    # Calculate histogram data
-    hist_values, bin_edges = np.histogram(end_values, bins=num_bins)
-    
+    return fig_paths
+
+def simulate_gbm_paths(s0, mu, sigma, n=24, T=30, num_paths=1000, plot=True, dtype=np.float64, variance_reduction=None, max_display_paths=None, seed=None, use_cache=False, workers=None, storage=None, sampler=None):
+    params = dict(s0=s0, mu=mu, sigma=sigma, n=n, T=T, num_paths=num_paths, dtype=dtype,
+                  variance_reduction=variance_reduction, seed=seed, workers=workers, storage=storage, sampler=sampler)
+    if not plot:
+        # Compute-only mode: the paths are returned and no figure is built
+        return cached_simulation('gbm_paths', params, gbm_paths, use_cache)
+    params['max_display_paths'] = max_display_paths
+    fig_paths = cached_simulation('simulate_gbm_paths', params, build_gbm_paths_figure, use_cache)
+    plotly_chart(fig_paths)
+
+def build_gbm_histogram_figure(s0, mu, sigma, n=24, T=30, num_paths=1000, num_bins=20, dtype=np.float64, variance_reduction=None, max_display_paths=None, seed=None, workers=None, storage=None, sampler=None):
+    t, S, hist_values, bin_edges = compute_gbm_histogram(s0, mu, sigma, n=n, T=T, num_paths=num_paths, num_bins=num_bins, dtype=dtype,
+                                                         variance_reduction=variance_reduction, seed=seed, workers=workers, storage=storage, sampler=sampler)
+    with span('figure'):
+        return gbm_histogram_figure(t, S, hist_values, bin_edges, max_display_paths=max_display_paths)
+
+def compute_gbm_histogram(s0, mu, sigma, n=24, T=30, num_paths=1000, num_bins=20, dtype=np.float64, variance_reduction=None, seed=None, workers=None, storage=None, sampler=None):
+    t, S = gbm_paths(s0, mu, sigma, n=n, T=T, num_paths=num_paths, dtype=dtype, variance_reduction=variance_reduction, seed=seed, workers=workers, storage=storage, sampler=sampler)
+
+    # Calculate histogram data from the end values, over bins that only depend on the
+    # model so they stay put between reruns
+    with span('histogram'):
+        histogram = FixedEdgeHistogram.lognormal(s0, mu, sigma, T=T, num_bins=num_bins).update(S[:, -1])
+    return t, S, histogram.bin_counts, histogram.edges
+
+def gbm_histogram_figure(t, S, hist_values, bin_edges, max_display_paths=None):
     # Create subplots with one row and two columns
     fig = make_subplots(rows=1, cols=2, subplot_titles=('Stock Paths', 'End Value Histogram'), column_widths=[0.7, 0.3])
     
     # Add GBM paths to the first subplot
-    for i in range(num_paths):
-        fig.add_trace(go.Scatter(x=t, y=S[i,:], mode='lines', name=f'Path {i+1}'), row=1, col=1)
+    add_paths_trace(fig, t, S, max_display_paths=max_display_paths, row=1, col=1)
 
     
     # Add a bar chart with bins and counts to the second subplot
@@ -80,58 +140,267 @@ def simulate_gbm_paths_plotly_histogram_with_bins(s0, mu, sigma, n=24, T=30, num
         width=1000,
         height=500,
     )
-    
-    st.plotly_chart(fig)
+    return fig
 
-def simulate_gbm_paths_plotly_histogram_with_bins_and_color(s0, mu, sigma, n=24, T=30, num_paths=1000, num_bins=20, strike_threshold=200):
-    dt = 1/n
-    t = np.linspace(0, T, n*T+1)
-    S = np.zeros((num_paths, n*T+1))
-    
-    for i in range(num_paths):
-        W = np.random.standard_normal(size=n*T+1)
-        W = np.cumsum(W)*np.sqrt(dt)
-        X = (mu-0.5*sigma**2)*t + sigma*W
-        S[i,:] = s0*np.exp(X)
+def simulate_gbm_paths_plotly_histogram_with_bins(s0, mu, sigma, n=24, T=30, num_paths=1000, num_bins=20, plot=True, dtype=np.float64, variance_reduction=None, max_display_paths=None, seed=None, use_cache=False, workers=None, storage=None, sampler=None):
+    params = dict(s0=s0, mu=mu, sigma=sigma, n=n, T=T, num_paths=num_paths, num_bins=num_bins, dtype=dtype,
+                  variance_reduction=variance_reduction, seed=seed, workers=workers, storage=storage, sampler=sampler)
+    if not plot:
+        # Compute-only mode: (t, S, hist_values, bin_edges) without a figure
+        return cached_simulation('compute_gbm_histogram', params, compute_gbm_histogram, use_cache)
+    params['max_display_paths'] = max_display_paths
+    fig = cached_simulation('simulate_gbm_paths_plotly_histogram_with_bins', params, build_gbm_histogram_figure, use_cache)
     
-    # Calculate end values
-    end_values = S[:, -1]
-    
-    # Calculate histogram data
-    hist_values, bin_edges = np.histogram(end_values, bins=num_bins)
-    
-    # Create subplots with one row and two columns
-    fig = make_subplots(rows=1, cols=2, subplot_titles=('Stock Paths', 'End Value Histogram'), column_widths=[0.7, 0.3])
+    plotly_chart(fig)
+
+def simulate_gbm_end_values(s0, mu, sigma, n=24, T=30, num_paths=1000, num_bins=20, dtype=np.float64, display_paths=None, variance_reduction=None, seed=None, surface_strike=None, workers=None, sampler=None):
+    # Everything in the colored histogram that doesn't depend on the strike, so it
+    # can be cached and reused while only the strike slider moves
+    # Only the paths that get drawn need to be simulated step by step, the rest of
+    # the end values are drawn straight from the terminal distribution
+    if display_paths is None:
+        display_paths = num_paths
+    display_paths = min(display_paths, num_paths)
+
+    # The bins only depend on the model, so they don't move with the samples, and each
+    # batch of end values is counted as it's simulated
+    histogram = FixedEdgeHistogram.lognormal(s0, mu, sigma, T=T, num_bins=num_bins, surface_strike=surface_strike)
+
+    packed_paths = None
+    end_values = np.empty(0, dtype=dtype)
+    if display_paths > 0:
+        t, S = gbm_paths(s0, mu, sigma, n=n, T=T, num_paths=display_paths, dtype=dtype, variance_reduction=variance_reduction,
+                         surface_strike=surface_strike, seed=seed, workers=workers, sampler=sampler)
+        end_values = S[:, -1].copy()
+        with span('histogram'):
+            histogram.update(end_values)
+        with span('pack_paths'):
+            packed_paths = pack_paths(t, S)
+
+    if display_paths < num_paths:
+        terminal_values = gbm_terminal(s0, mu, sigma, T=T, num_paths=num_paths-display_paths, dtype=dtype,
+                                       variance_reduction=variance_reduction, surface_strike=surface_strike,
+                                       seed=child_seed(seed, TERMINAL_STREAM), workers=workers, sampler=sampler)
+        with span('histogram'):
+            histogram.update(terminal_values)
+        end_values = np.concatenate([end_values, terminal_values])
+
+    return packed_paths, end_values, histogram.bin_counts, histogram.edges
+
+def build_gbm_colored_histogram_figure(simulation, strike_threshold):
+    packed_paths, end_values, hist_values, bin_edges = simulation
     
-    # Add GBM paths to the first subplot
-    for i in range(num_paths):
-        fig.add_trace(go.Scatter(x=t, y=S[i,:], mode='lines', name=f'Path {i+1}'), row=1, col=1)
+    if packed_paths is not None:
+        # Create subplots with one row and two columns
+        fig = make_subplots(rows=1, cols=2, subplot_titles=('Stock Paths', 'End Value Histogram'), column_widths=[0.7, 0.3])
+        
+        # Add GBM paths to the first subplot
+        add_paths_trace(fig, None, None, packed_paths=packed_paths, row=1, col=1)
+        hist_position = dict(row=1, col=2)
+    else:
+        # The paths panel is hidden, so the histogram gets the whole figure
+        fig = go.Figure()
+        hist_position = dict()
 
-    colors_strike = ['red' if x < strike_threshold else 'green' for x in bin_edges[:-1]]
+    colors_strike = np.where(bin_edges[:-1] < strike_threshold, 'red', 'green')
     
     # Add a bar chart with bins and counts to the second subplot
-    fig.add_trace(go.Bar(y=bin_edges[:-1], x=hist_values, orientation='h', marker_color=colors_strike, name='End Values'), row=1, col=2)
+    fig.add_trace(go.Bar(y=bin_edges[:-1], x=hist_values, orientation='h', marker_color=colors_strike, name='End Values'), **hist_position)
     
     # Update layout
+    if packed_paths is not None:
+        fig.update_layout(
+            title='Simulated Stock Paths and Colored Expiration Price Distribution',
+            xaxis_title='Counts',
+            yaxis_title='Price',
+            xaxis2=dict(domain=[0.75, 1.0]),
+            yaxis2=dict(anchor='x2'),
+            showlegend=False,  # Set to False to avoid legend duplication
+            width=1000,
+            height=500,
+        )
+    else:
+        fig.update_layout(
+            title='Colored Expiration Price Distribution',
+            xaxis_title='Counts',
+            yaxis_title='Price',
+            showlegend=False,
+            width=1000,
+            height=500,
+        )
+    
+    return fig
+
+def simulate_gbm_paths_plotly_histogram_with_bins_and_color(s0, mu, sigma, n=24, T=30, num_paths=1000, num_bins=20, strike_threshold=200, plot=True, dtype=np.float64, display_paths=None, variance_reduction=None, seed=None, use_cache=False, workers=None, sampler=None):
+    # The strike only recolors the bins, so it's left out of the simulation (and its
+    # cache key) unless sigma is a volatility surface that's read at the strike
+    surface_strike = strike_threshold if hasattr(sigma, 'forward_vols') else None
+    params = dict(s0=s0, mu=mu, sigma=sigma, n=n, T=T, num_paths=num_paths, num_bins=num_bins, dtype=dtype,
+                  display_paths=display_paths, variance_reduction=variance_reduction, seed=seed, surface_strike=surface_strike, workers=workers, sampler=sampler)
+    simulation = cached_simulation('simulate_gbm_end_values', params, simulate_gbm_end_values, use_cache)
+    if plot:
+        with span('figure'):
+            fig = build_gbm_colored_histogram_figure(simulation, strike_threshold)
+        plotly_chart(fig)
+
+    end_values = simulation[1]
+    return end_values, strike_threshold
+
+
+def call_option_asset(end_values, strike_value, display=True):
+    price = fair_price(end_values, strike_value)
+    if display:
+        st.latex("\\text{Simulated Fair Price: }")
+        st.latex(price)
+    return price
+
+
+def call_option_asset_streaming(s0, mu, sigma, strike_value, T=30, target_std_error=0.01, time_budget=1.0, max_paths=10_000_000, confidence=0.95, variance_reduction=None, seed=None, workers=None, num_bins=20):
+    pricer = price_gbm_option
+    if workers is not None and workers > 1:
+        pricer = partial(parallel_option_price, workers=workers)
+    with span('streaming_price'):
+        estimate = pricer(s0, mu, sigma, strike_value, T=T, target_std_error=target_std_error,
+                          time_budget=time_budget, max_paths=max_paths, confidence=confidence,
+                          variance_reduction=variance_reduction, seed=seed, num_bins=num_bins)
+    half_width = estimate.ci_high - estimate.price
+    st.latex("\\text{Simulated Fair Price: }")
+    st.latex(f"{estimate.price:.4f} \\pm {half_width:.4f}")
+    st.caption(f"{confidence:.0%} confidence interval from {estimate.num_paths:,} simulated paths")
+    if estimate.histogram is not None:
+        # Counted from every streamed path, not just the ones in the histogram above
+        st.caption(f"{estimate.histogram.in_the_money(strike_value):.1%} of them finish in the money")
+    if variance_reduction is not None and np.isfinite(estimate.variance_reduction_factor):
+        st.caption(f"Variance reduction factor: {estimate.variance_reduction_factor:.1f}x fewer paths than plain Monte Carlo for the same accuracy")
+    return estimate
+
+
+def call_option_asset_qmc(s0, mu, sigma, strike_value, T=30, num_paths=1024, replications=16, n=None, confidence=0.95, seed=None):
+    # With n set the paths are built step by step with a Brownian bridge, n steps per day
+    with span('qmc_price'):
+        estimate = qmc_option_price(s0, mu, sigma, strike_value, T=T, num_paths=num_paths, replications=replications, n=n,
+                                    confidence=confidence, seed=seed)
+    half_width = estimate.ci_high - estimate.price
+    st.latex("\\text{Quasi-Monte Carlo Price: }")
+    st.latex(f"{estimate.price:.4f} \\pm {half_width:.4f}")
+    caption = f"{confidence:.0%} confidence interval from {replications} scrambled Sobol replications of {num_paths:,} paths"
+    if np.isfinite(estimate.variance_reduction_factor):
+        caption += f", as accurate as {estimate.variance_reduction_factor:.0f}x as many plain Monte Carlo paths"
+    st.caption(caption)
+    return estimate
+
+
+def black_scholes_option_asset(s0, strike_value, T, sigma, r=0.0, option_type='call'):
+    price = float(black_scholes_price(s0, strike_value, T, sigma, r=r, option_type=option_type))
+    st.latex("\\text{Black-Scholes Price: }")
+    st.latex(f"{price:.4f}")
+    return price
+
+
+def option_greeks_table(s0, strike_value, T, sigma, end_values=None, r=0.0, option_type='call'):
+    greek_names = FIRST_ORDER_GREEKS + SECOND_ORDER_GREEKS
+    analytic = black_scholes_greeks(s0, strike_value, T, sigma, r=r, option_type=option_type)
+    # Greeks without a value (at the forward with no volatility left) are left blank
+    table = {'Greek': [name.capitalize() for name in greek_names],
+             'Black-Scholes': [float(analytic[name]) if np.isfinite(analytic[name]) else None for name in greek_names]}
+
+    # The simulated end values are reused, so the Monte Carlo Greeks cost no extra paths
+    if end_values is not None and sigma > 0:
+        estimates = monte_carlo_greeks(end_values, s0, strike_value, T, sigma, r=r, option_type=option_type)
+        table['Pathwise'] = [float(estimates['pathwise'][name][0]) if name in estimates['pathwise'] else None for name in greek_names]
+        table['Likelihood Ratio'] = [float(estimates['likelihood_ratio'][name][0]) if name in estimates['likelihood_ratio'] else None for name in greek_names]
+
+    st.table(table)
+    if None in table['Black-Scholes']:
+        st.caption("With no volatility left an option struck at the forward has no Greeks, since its delta jumps there")
+    return table
+
+
+def build_delta_hedge_figure(s0, strike_value, T, implied_sigma, realized_sigma, rebalance_every=1, n=24, num_paths=2000, option_type='call', side='long', seed=None):
+    t, S = generate_gbm_paths(s0, 0.0, realized_sigma, n=n, T=T, num_paths=num_paths, seed=seed)
+    with span('hedge'):
+        hedged = delta_hedge_pnl(t, S, strike_value, implied_sigma, option_type=option_type, side=side, rebalance_every=rebalance_every)
+
+    fig = make_subplots(rows=1, cols=2, subplot_titles=('Hedged P&L', 'P&L vs Realized - Implied Volatility'))
+    fig.add_trace(go.Histogram(x=np.round(hedged['pnl'], 4), nbinsx=50, name='Hedged P&L'), row=1, col=1)
+    fig.add_trace(go.Scattergl(x=np.round((hedged['realized_vol'] - implied_sigma)*1e3, 4), y=np.round(hedged['pnl'], 4),
+                               mode='markers', marker=dict(size=3), name='Paths'), row=1, col=2)
     fig.update_layout(
-        title='Simulated Stock Paths and Colored Expiration Price Distribution',
-        xaxis_title='Counts',
-        yaxis_title='Price',
-        xaxis2=dict(domain=[0.75, 1.0]),
-        yaxis2=dict(anchor='x2'),
-        showlegend=False,  # Set to False to avoid legend duplication
+        title=f"Delta Hedged {side.capitalize()} {option_type.capitalize()} (Rebalanced Every {rebalance_every} Steps)",
+        xaxis_title='Profit',
+        yaxis_title='Count',
+        xaxis2_title='Realized - Implied Volatility',
+        yaxis2_title='Profit',
+        showlegend=False,
         width=1000,
         height=500,
     )
-    
-    st.plotly_chart(fig)
+    return fig, float(hedged['pnl'].mean()), float(hedged['gamma_pnl'].mean())
 
-    return end_values, strike_threshold
 
+def simulate_delta_hedge(s0, strike_value, T, implied_sigma, realized_sigma, rebalance_every=1, n=24, num_paths=2000, option_type='call', side='long', seed=None, use_cache=False):
+    params = dict(s0=s0, strike_value=strike_value, T=T, implied_sigma=implied_sigma, realized_sigma=realized_sigma,
+                  rebalance_every=rebalance_every, n=n, num_paths=num_paths, option_type=option_type, side=side, seed=seed)
+    fig, mean_pnl, mean_gamma_pnl = cached_simulation('simulate_delta_hedge', params, build_delta_hedge_figure, use_cache)
 
-def call_option_asset(end_values, strike_value):
-    payoffs = end_values - strike_value
-    payoffs = np.clip(payoffs, 0, None)
-    st.latex("\\text{Simulated Fair Price: }")
-    st.latex(payoffs.mean())
-    return payoffs.mean()
+    plotly_chart(fig)
+    st.caption(f"Average hedged P&L {mean_pnl:.4f}, of which {mean_gamma_pnl:.4f} is explained by gamma times realized minus implied variance")
+    return mean_pnl
+
+
+def american_option_asset(s0, strike_value, T, sigma, r=0.0, option_type='put', n=1, num_paths=20000, seed=None, use_cache=False):
+    with span('binomial_tree'):
+        lattice = binomial_american_price(s0, strike_value, T, sigma, r=r, option_type=option_type)
+
+    # The regression estimate reruns on the simulated paths, so it's cached like the other simulations
+    params = dict(s0=s0, strike_value=strike_value, T=T, sigma=sigma, r=r, option_type=option_type, n=n, num_paths=num_paths, seed=seed)
+    simulated = cached_simulation('longstaff_schwartz_price', params, build_longstaff_schwartz_price, use_cache)
+
+    european_col, american_col, premium_col = st.columns(3)
+    with european_col:
+        st.latex("\\text{Only at Expiry: }")
+        st.latex(f"{lattice.european_price:.2f}")
+    with american_col:
+        st.latex("\\text{Any Time: }")
+        st.latex(f"{lattice.price:.2f}")
+    with premium_col:
+        st.latex("\\text{Early Exercise Premium: }")
+        st.latex(f"{lattice.early_exercise_premium:.2f}")
+    st.caption(f"From a 2,000 step binomial tree. Longstaff-Schwartz on {num_paths:,} simulated paths gives "
+               f"{simulated.price:.2f} ± {1.96*simulated.std_error:.2f} (early exercise premium {simulated.early_exercise_premium:.2f})")
+    return lattice, simulated
+
+
+def build_longstaff_schwartz_price(s0, strike_value, T, sigma, r=0.0, option_type='put', n=1, num_paths=20000, seed=None):
+    # Paths are simulated risk-neutrally (mu = r) with n exercise dates per day
+    t, S = generate_gbm_paths(s0, r, sigma, n=n, T=T, num_paths=num_paths, seed=seed)
+    return longstaff_schwartz_price(t, S, strike_value, r=r, option_type=option_type)
+
+
+def rerun_timings_sidebar(profiler, num_reruns=5):
+    reruns = list(profiler.history)[-num_reruns:][::-1]
+    if not reruns:
+        return
+    latest = reruns[0]
+
+    st.sidebar.subheader('Rerun Timings')
+    st.sidebar.caption(f"Last {'rerun' if latest.scope == 'app' else latest.scope + ' rerun'} took {latest.seconds*1e3:.0f} ms. "
+                       "Fragment reruns show up here on the next full rerun.")
+    # Every span of the last rerun, indented by how deeply it's nested
+    st.sidebar.table({'Span': ['\u2003'*span.depth + span.name for span in latest.spans],
+                      'ms': [round(span.seconds*1e3, 1) for span in latest.spans]})
+
+    # Page sections over the last few reruns, newest first. A fragment rerun only has
+    # its own section, and its column is labelled with the fragment's name.
+    sections = list(dict.fromkeys(name for profile in reruns for name in profile.section_seconds()))
+    history = {'Section': sections + ['Total']}
+    for i, profile in enumerate(reruns):
+        seconds = profile.section_seconds()
+        label = ('Last' if i == 0 else f'{i} before') + ('' if profile.scope == 'app' else f' ({profile.scope})')
+        history[label] = [round(seconds.get(name, np.nan)*1e3, 1) for name in sections] + [round(profile.seconds*1e3, 1)]
+    st.sidebar.table(history)
+
+    if latest.figures:
+        st.sidebar.table({'Figure': [name for name, _ in latest.figures],
+                          'KiB': [round(num_bytes/2**10, 1) for _, num_bytes in latest.figures]})
+    st.sidebar.download_button('Download timings (JSON lines)', profiler.export_jsonl(), file_name='rerun_timings.jsonl')
@@ -0,0 +1,95 @@
+import numpy as np
+
+from utils.implied_vol import implied_volatility
+
+
+class VolSurface:
+    # Implied vols on a strikes x expiries grid (same units as the simulators: T in
+    # days, vols per sqrt(day)). Total variance sigma^2*T is interpolated bilinearly
+    # inside each grid cell, with the four coefficients of every cell computed once
+    # up front so a lookup is two small searchsorteds and one polynomial per point.
+    # Outside the grid the vol is held flat.
+    def __init__(self, strikes, expiries, vols):
+        strikes = np.asarray(strikes, dtype=np.float64)
+        expiries = np.asarray(expiries, dtype=np.float64)
+        vols = np.asarray(vols, dtype=np.float64)
+        if strikes.ndim != 1 or strikes.size < 2 or np.any(np.diff(strikes) <= 0):
+            raise ValueError("strikes must be at least two increasing values")
+        if expiries.ndim != 1 or expiries.size < 1 or np.any(np.diff(expiries) <= 0) or expiries[0] <= 0:
+            raise ValueError("expiries must be increasing positive values")
+        if vols.shape != (expiries.size, strikes.size):
+            raise ValueError(f"vols must have shape (len(expiries), len(strikes)) = {(expiries.size, strikes.size)}, got {vols.shape}")
+        if not np.all(np.isfinite(vols)) or np.any(vols < 0):
+            raise ValueError("vols must be finite and non-negative (prices outside the no-arbitrage bounds have no implied vol)")
+
+        self.strikes = strikes
+        self.expiries = expiries
+        self.vols = vols
+        self.coefficients = self._interpolation_coefficients(strikes, expiries, vols)
+
+    @classmethod
+    def from_option_prices(cls, prices, s0, strikes, expiries, r=0.0, option_type='call'):
+        # prices has one row per expiry and one column per strike
+        strikes = np.asarray(strikes, dtype=np.float64)
+        expiries = np.asarray(expiries, dtype=np.float64)
+        vols = implied_volatility(prices, s0, strikes[None, :], expiries[:, None], r=r, option_type=option_type)
+        return cls(strikes, expiries, vols)
+
+    @staticmethod
+    def _interpolation_coefficients(strikes, expiries, vols):
+        # A single expiry is treated as a flat term structure
+        if expiries.size == 1:
+            expiries = np.append(expiries, 2*expiries[0])
+            vols = np.vstack([vols, vols])
+
+        w = vols**2*expiries[:, None]
+        w00, w01 = w[:-1, :-1], w[:-1, 1:]
+        w10, w11 = w[1:, :-1], w[1:, 1:]
+
+        # w = c0 + c1*u + c2*v + c3*u*v with u, v the position inside the cell
+        # along the strike and expiry axes
+        return np.stack([w00, w01 - w00, w10 - w00, w11 - w10 - w01 + w00], axis=-1)
+
+    def total_variance(self, strike, T):
+        strike = np.asarray(strike, dtype=np.float64)
+        T = np.asarray(T, dtype=np.float64)
+        return self.vol(strike, T)**2*T
+
+    def vol(self, strike, T):
+        strike, T = np.broadcast_arrays(np.asarray(strike, dtype=np.float64), np.asarray(T, dtype=np.float64))
+        expiries = self.expiries if self.expiries.size > 1 else np.append(self.expiries, 2*self.expiries[0])
+
+        strike = np.clip(strike, self.strikes[0], self.strikes[-1])
+        T = np.clip(T, expiries[0], self.expiries[-1])
+
+        i = np.clip(np.searchsorted(self.strikes, strike, side='right') - 1, 0, self.strikes.size - 2)
+        j = np.clip(np.searchsorted(expiries, T, side='right') - 1, 0, expiries.size - 2)
+        u = (strike - self.strikes[i])/(self.strikes[i + 1] - self.strikes[i])
+        v = (T - expiries[j])/(expiries[j + 1] - expiries[j])
+
+        c = self.coefficients[j, i]
+        w = c[..., 0] + c[..., 1]*u + c[..., 2]*v + c[..., 3]*u*v
+        return np.sqrt(np.maximum(w, 0)/T)
+
+    def forward_vols(self, strike, t):
+        # Per-step vols between consecutive times in t, so that simulating with them
+        # reproduces the surface's total variance at strike for every time in t
+        t = np.asarray(t, dtype=np.float64)
+        w = np.zeros_like(t)
+        w[t > 0] = self.total_variance(strike, t[t > 0])
+        forward_variance = np.maximum(np.diff(w), 0)/np.diff(t)
+        return np.sqrt(forward_variance)
+
+    def save(self, path):
+        np.savez(path, strikes=self.strikes, expiries=self.expiries, vols=self.vols, coefficients=self.coefficients)
+
+    @classmethod
+    def load(cls, path):
+        # Reuses the stored coefficients instead of rebuilding them
+        with np.load(path) as data:
+            surface = cls.__new__(cls)
+            surface.strikes = data['strikes']
+            surface.expiries = data['expiries']
+            surface.vols = data['vols']
+            surface.coefficients = data['coefficients']
+        return surface